@@ -0,0 +1,76 @@
+"""
+Benchmark of the construction time of `ID29EM` quad electrometers.
+
+Builds fake (no EPICS connection) instances of `ID29EM`, which resolves the
+29-ID 'kind' of its components once per class, and of a copy of the previous
+implementation, which walked the device tree of every instance to re-write
+the 'kind' of each signal and sub-device by name.
+
+Run with ``python benchmarks/bench_id29em.py [n_instances]``.
+"""
+
+from __future__ import annotations
+
+import sys
+import timeit
+
+from ophyd import Component
+from ophyd.quadem import NSLS_EM, QuadEMPort
+from ophyd.sim import make_fake_device
+
+from ari_sxn_common.common_ophyd import ID29EM
+
+
+class WalkingID29EM(NSLS_EM):
+    """
+    The previous `ID29EM`, which walks the device tree in `__init__`.
+    """
+    conf = Component(QuadEMPort, port_name='EM180', kind='config')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        signals_list = [(signal.dotted_name, signal.item)
+                        for signal in self.walk_signals()
+                        if '.' not in signal.dotted_name]
+        devices_list = [(name, device)
+                        for (name, device) in self.walk_subdevices()]
+        for (name, device) in signals_list + devices_list:
+            if name in ['current1', 'current2', 'current3', 'current4']:
+                device.kind = 'hinted'
+                device.nd_array_port.put('EM180')
+            elif name in ['values_per_read', 'averaging_time',
+                          'integration_time', 'num_average', 'num_acquire',
+                          'em_range']:
+                device.kind = 'config'
+            elif hasattr(device, 'kind'):
+                device.kind = 'omitted'
+
+
+def build(device_class, n_instances):
+    """
+    Builds n_instances of device_class.
+    """
+    return [device_class(f'EM{i}:', name=f'em{i}')
+            for i in range(n_instances)]
+
+
+def main(n_instances=50, repeat=5):
+    classes = {'tree walk per instance': make_fake_device(WalkingID29EM),
+               'class-level kinds': make_fake_device(ID29EM)}
+    # The kinds, and so the read and configuration attrs, must be the same.
+    walking, current = (build(cls, 1)[0] for cls in classes.values())
+    assert walking.read_attrs == current.read_attrs
+    assert walking.configuration_attrs == current.configuration_attrs
+
+    print(f'constructing {n_instances} fake ID29EM instances')
+    for label, device_class in classes.items():
+        best = min(timeit.repeat(lambda cls=device_class: build(cls,
+                                                                n_instances),
+                                 repeat=repeat, number=1))
+        print(f'  {label:<24}{best * 1e3:>10.1f} ms '
+              f'({best / n_instances * 1e3:.2f} ms per instance)')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,55 @@
+"""
+Import-time budget check for the ari_sxn_common modules.
+
+Imports each module in a fresh interpreter with ``python -X importtime`` and
+compares the cumulative import time (including all of its dependencies) with
+a budget. `ari_sxn_common.locations` is kept free of ophyd so that locations
+files can be read and checked quickly, while `ari_sxn_common.common_ophyd` is
+dominated by ``import ophyd`` (which itself imports ophyd.areadetector).
+
+Run with ``python benchmarks/bench_import.py [repeat]``, the exit status is
+non-zero if any module is over its budget.
+"""
+
+from __future__ import annotations
+
+import subprocess
+import sys
+
+# The budget, in ms, for the cumulative import time of each module.
+BUDGETS = {'ari_sxn_common.locations': 250,
+           'ari_sxn_common.common_ophyd': 1500}
+
+
+def import_time(module):
+    """
+    Returns the cumulative import time of module, in ms, in a new interpreter.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             f'import {module}'],
+                            capture_output=True, text=True, check=True)
+    # The lines are 'import time: self [us] | cumulative | imported package'.
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1e3
+    raise RuntimeError(f'no -X importtime entry found for {module}')
+
+
+def main(repeat=3):
+    over_budget = []
+    print(f'cumulative import times (best of {repeat})')
+    for module, budget in BUDGETS.items():
+        best = min(import_time(module) for _ in range(repeat))
+        status = 'ok' if best <= budget else 'OVER BUDGET'
+        print(f'  {module:<32}{best:>8.1f} ms (budget {budget} ms) {status}')
+        if best > budget:
+            over_budget.append(module)
+
+    return 1 if over_budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*(int(arg) for arg in sys.argv[1:2])))
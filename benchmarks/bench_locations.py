@@ -0,0 +1,87 @@
+"""
+Benchmark of the location look-up used by `DeviceWithLocations`.
+
+Compares, for a table of synthetic locations over several axes, the
+nested-loop look-up that `LocationSignal.get()` used to perform with a full
+vectorized scan and with the interval index used by `LocationsTable`.
+
+Run with ``python benchmarks/bench_locations.py [n_locations]``.
+"""
+
+from __future__ import annotations
+
+import sys
+import timeit
+
+import numpy as np
+
+from ari_sxn_common.locations import LocationsTable
+
+AXES = ('x', 'y', 'z', 'theta')
+
+
+def make_locations(n_locations, seed=0):
+    """
+    Returns a locations_data dictionary of synthetic sample holder positions.
+    """
+    rng = np.random.default_rng(seed)
+    return {f'position{i}': {axis: (float(rng.uniform(-100, 100)),
+                                    float(rng.uniform(0.05, 0.5)))
+                             for axis in AXES if rng.random() < 0.9}
+            for i in range(n_locations)}
+
+
+def nested_loop(locations_data, values):
+    """
+    The nested-loop look-up previously done by `LocationSignal.get()`.
+    """
+    locations = []
+    for location, location_data in locations_data.items():
+        value_check = []
+        for signal_name, data in location_data.items():
+            value = values[signal_name]
+            value_check.append(data[0] - data[1] < value < data[0] + data[1])
+        if all(value_check):
+            locations.append(location)
+
+    return locations
+
+
+def full_scan(table, values):
+    """
+    A vectorized look-up that checks every location against each value.
+    """
+    satisfied = np.zeros(len(table.names), dtype=int)
+    for signal_name, column in table.signals.items():
+        mask = table.match(signal_name, values[signal_name])
+        satisfied[column['index'][mask]] += 1
+
+    return [table.names[i] for i in np.flatnonzero(satisfied ==
+                                                   table.required)]
+
+
+def main(n_locations=10_000, repeat=5, number=20):
+    locations_data = make_locations(n_locations)
+    start = timeit.default_timer()
+    table = LocationsTable(locations_data)
+    compile_time = timeit.default_timer() - start
+
+    # Sit on one of the locations so that the look-up has a match.
+    target = locations_data['position0']
+    values = {axis: target.get(axis, (0.0, None))[0] for axis in AXES}
+    expected = nested_loop(locations_data, values)
+    assert full_scan(table, values) == expected
+    assert table.evaluate(values) == expected
+
+    print(f'{n_locations} locations over {len(AXES)} axes, '
+          f'compiled in {compile_time * 1e3:.1f} ms, matches: {expected}')
+    for label, function in (
+            ('nested loop', lambda: nested_loop(locations_data, values)),
+            ('full vectorized scan', lambda: full_scan(table, values)),
+            ('interval index', lambda: table.evaluate(values))):
+        best = min(timeit.repeat(function, repeat=repeat, number=number))
+        print(f'  {label:<22}{best / number * 1e6:>12.1f} us per look-up')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,173 @@
+"""
+Image analysis run outside of the RunEngine thread (and process).
+
+Kept free of ophyd so that the worker processes used by `ImageAnalysis` only
+need to import NumPy and this module.
+"""
+
+import functools
+import numpy as np
+import threading
+
+
+def fit_gaussian_2d(image, threshold=0.1):
+    """
+    Fits an (axis-aligned) 2-D Gaussian to the image of a beam.
+
+    The median of the image is subtracted as the background and the log of
+    the pixels above threshold * the peak value is then fitted, by weighted
+    linear least squares, with a quadratic in x and y (Caruana's method, with
+    the pixel values as weights). This is a single vectorized pass that does
+    not need an initial guess.
+
+    Parameters
+    ----------
+    image : numpy.ndarray
+        The (height, width) or (height, width, 3) image.
+    threshold : float, optional
+        The fraction of the peak (background subtracted) value above which
+        pixels are included in the fit, defaults to 0.1.
+
+    Returns
+    -------
+    fit : {str: float}
+        The fitted 'amplitude', centre 'x' and 'y' and widths 'sigma_x' and
+        'sigma_y', in pixels. All of them are NaN if the image has no peak.
+    """
+    image = np.asarray(image, dtype=np.float64)
+    if image.ndim == 3:
+        image = image.sum(axis=2)
+    image = image - np.median(image)
+    fit = dict.fromkeys(('amplitude', 'x', 'y', 'sigma_x', 'sigma_y'), np.nan)
+    peak = image.max()
+    if not peak > 0:
+        return fit
+
+    y, x = np.nonzero(image > threshold * peak)
+    values = image[y, x]
+    # Centre the coordinates to keep the least squares well conditioned.
+    x_mean, y_mean = x.mean(), y.mean()
+    x, y = x - x_mean, y - y_mean
+    design = np.column_stack([np.ones_like(x), x, y, x ** 2, y ** 2])
+    (a, b, c, d, e), *_ = np.linalg.lstsq(design * values[:, None],
+                                         np.log(values) * values, rcond=None)
+    if d >= 0 or e >= 0:  # not a peak along one of the axes.
+        return fit
+
+    amplitude = np.exp(a - b ** 2 / (4 * d) - c ** 2 / (4 * e))
+    fit.update(amplitude=float(amplitude),
+               x=float(x_mean - b / (2 * d)), y=float(y_mean - c / (2 * e)),
+               sigma_x=float(np.sqrt(-1 / (2 * d))),
+               sigma_y=float(np.sqrt(-1 / (2 * e))))
+
+    return fit
+
+
+class ImageAnalysis():
+    """
+    Runs an analysis function on images in a pool of worker processes.
+
+    Images are queued with `self.submit(image, callback)`, which never blocks.
+    Once `max_pending` images are queued (or being analysed) further images
+    are dropped, and counted in `self.dropped`, until one finishes, so a slow
+    analysis reduces the fraction of images analysed rather than the
+    acquisition rate. The worker processes are only started when the first
+    image is submitted, using the 'spawn' start method as the submitting
+    process is multi-threaded. Like the worker processes, concurrent.futures
+    is only imported then, not when this module is imported. If the pool
+    breaks (e.g. a worker process crashes) the image is dropped and a new
+    pool is started for the next one.
+
+    Parameters
+    ----------
+    function : callable
+        The (picklable, e.g. module level) function called, in a worker
+        process, with each image. It should return a picklable result.
+    max_pending : int, optional
+        The maximum number of queued or running analyses, defaults to 4.
+    max_workers : int, optional
+        The number of worker processes, defaults to 2.
+
+    Attributes
+    ----------
+    dropped : int
+        The number of images that have been dropped because the queue was
+        full.
+
+    Methods
+    -------
+    submit(image, callback) :
+        Queues image for analysis, unless the queue is full.
+    close() :
+        Cancels the queued analyses and shuts down the worker processes.
+    """
+    def __init__(self, function, max_pending=4, max_workers=2):
+        self.function = function
+        self.max_pending = max_pending
+        self.max_workers = max_workers
+        self.dropped = 0
+        self._futures = set()  # the queued, or running, analyses.
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def submit(self, image, callback):
+        """
+        Queues image for analysis, unless the queue is full.
+
+        Parameters
+        ----------
+        image : numpy.ndarray
+            The image to analyse, it is pickled to send it to the worker.
+        callback : callable
+            Called, with the `concurrent.futures.Future` of the analysis, once
+            it has finished (or failed).
+
+        Returns
+        -------
+        queued : bool
+            True if the image was queued, False if it was dropped.
+        """
+        with self._lock:
+            if len(self._futures) >= self.max_pending:
+                self.dropped += 1
+                return False
+            if self._executor is None:
+                from concurrent.futures import ProcessPoolExecutor
+                import multiprocessing
+
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'))
+            executor = self._executor
+            try:
+                future = executor.submit(self.function, image)
+            except RuntimeError:  # closed, or broken (BrokenProcessPool).
+                if self._executor is executor:
+                    self._executor = None
+                self.dropped += 1
+                return False
+            self._futures.add(future)
+
+        future.add_done_callback(functools.partial(self._finished, callback))
+
+        return True
+
+    def _finished(self, callback, future):
+        """
+        Frees the queue slot of a finished analysis and runs its callback.
+        """
+        with self._lock:
+            self._futures.discard(future)
+        callback(future)
+
+    def close(self):
+        """
+        Cancels the queued analyses and shuts down the worker processes.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+            futures = list(self._futures)
+        for future in futures:  # shutdown(cancel_futures=True) needs 3.9+
+            future.cancel()
+        if executor is not None:
+            executor.shutdown(wait=True)
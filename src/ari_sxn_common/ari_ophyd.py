@@ -1,6 +1,11 @@
-from common_ophyd import (BaffleSlit, Diagnostic, DeviceWithLocations,
-                          ID29EpicsMotor, ID29EpicsSignalRO)
+from ari_sxn_common.common_ophyd import (BaffleSlit, Diagnostic,
+                                         DeviceWithLocations, ID29EpicsMotor,
+                                         ID29EpicsSignalRO)
 from ophyd import Component
+from pathlib import Path
+
+# The locations of the M1 devices, 'slits', 'diag' and 'm1' tables.
+M1_LOCATIONS = Path(__file__).with_name('m1_locations.toml')
 
 
 class M1(DeviceWithLocations):
@@ -11,7 +16,10 @@ class M1(DeviceWithLocations):
     -pipe, the associated Diagnostic and BaffleSlit sub-devices and the
     motors, detectors and vacuum signals for these. It is designed to
     provide an intuitive, tab-to-complete based, interface to find all
-    the components associated with the M1 mirror.
+    the components associated with the M1 mirror. The slits and diag
+    sub-devices (and the diag camera and currents) are lazy, they are only
+    built, and connected, when first accessed so a session that only uses
+    the mirror motors does not create their PVs.
 
     Parameters
     ----------
@@ -44,6 +52,8 @@ class M1(DeviceWithLocations):
         The baffle slit downstream of the mirror chamber
     diag : Diagnostic
         The diagnostic device downstream of the mirror chamber
+    photocurrent : EpicsSignalRO
+        The mirror current, read from self.diag.currents.current1.mean_value
 
     Methods
     -------
@@ -54,15 +64,22 @@ class M1(DeviceWithLocations):
         the child `BaffleSlit` class, and the child `Diagnostic` class and
         returns a combination of all of the status objects.
     """
+    # photocurrent links to the mirror current on the self.diag quadem
+    _aliases = {'photocurrent': 'diag.currents.current1.mean_value'}
+
     def __init__(self, *args, **kwargs):
         """
-        A new __init__ method that links photocurrent to the self.diag quadem
+        A new __init__ method that sets up photocurrent when it is built
         """
         super().__init__(*args, **kwargs)
-        self.diag.currents.current1.mean_value.name = (f'{self.name}'
-                                                       f'_photocurrent')
-        self.diag.currents.current1.mean_value.kind = 'hinted'
-        setattr(self, 'photocurrent', self.diag.currents.current1.mean_value)
+        self.on_component('diag.currents', self._setup_photocurrent)
+
+    def _setup_photocurrent(self, currents):
+        """
+        Renames and hints the self.diag.currents.current1.mean_value signal
+        """
+        currents.current1.mean_value.name = f'{self.name}_photocurrent'
+        currents.current1.mean_value.kind = 'hinted'
 
     # Mirror motor axes
     Ry_coarse = Component(ID29EpicsMotor, 'Ry_coarse', name='Ry_coarse',
@@ -86,34 +103,13 @@ class M1(DeviceWithLocations):
 
     # baffle slit sub-device
     slits = Component(BaffleSlit, "baffle:", name='slits', kind='normal',
-                      labels=('device',),
-                      locations_data={'in': {'top': (-12.7, 0.1),
-                                             'bottom': (12.7, 0.1),
-                                             'inboard': (12.7, 0.1),
-                                             'outboard': (-12.7, 0.1)},
-                                      'centre': {'top': (0, 0.1),
-                                                 'bottom': (0, 0.1),
-                                                 'inboard': (0, 0.1),
-                                                 'outboard': (0, 0.1)},
-                                      'nominal': {'top': (12.7, 0.1),
-                                                  'bottom': (-12.7, 0.1),
-                                                  'inboard': (-12.7, 0.1),
-                                                  'outboard': (12.7, 0.1)},
-                                      'out': {'top': (28, 0.1),
-                                              'bottom': (-28, 0.1),
-                                              'inboard': (-28, 0.1),
-                                              'outboard': (28, 0.1)}})
+                      labels=('device',), skip_satisfied=True, lazy=True,
+                      locations_file=M1_LOCATIONS, locations_key='slits')
 
     # diagnostic sub-device
     diag = Component(Diagnostic, "diag:", name='diag', kind='normal',
-                     labels=('device',),
-                     locations_data={'Out': {'blade': (0, 1)},
-                                     'YaG': {'blade': (-31.75, 1),
-                                             'filter': (0, 1)},
-                                     'ML250': {'blade': (-63.5, 1),
-                                               'filter': (-25, 1)},
-                                     'ML700': {'blade': (-95.25, 1),
-                                               'filter': (-25, 1)}})
+                     labels=('device',), skip_satisfied=True, lazy=True,
+                     locations_file=M1_LOCATIONS, locations_key='diag')
 
     def trigger(self):
         """
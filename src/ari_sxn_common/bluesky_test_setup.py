@@ -1,29 +1,98 @@
-""" This file is used to setup a bluesky session with standard items"""
-from ari_ophyd import M1
-from bluesky import RunEngine
-from bluesky.callbacks.best_effort import BestEffortCallback
-from bluesky.plans import count, scan, grid_scan
-from bluesky.utils import ProgressBarManager
-from databroker import Broker
-from ophyd.signal import EpicsSignalBase
+""" This file is used to setup a bluesky session with standard items
+
+Two environment variables change how the session is set up:
+
+- ``ARI_STARTUP_PROFILE``: when set to a file path the time taken by each
+  phase of the setup (imports, RunEngine, callbacks, databroker, device
+  construction and connection) is written there as a JSON report, see
+  `startup_report`.
+- ``ARI_SIMULATE``: when set to a non-empty value the devices are built with
+  `ophyd.sim.make_fake_device`, so that the setup (and its profile) can be
+  run offline without the IOCs.
+"""
+import contextlib
+import time
+
+startup_report = {'start': time.time(), 'phases': {}}
+_startup_clock = time.perf_counter()
+
+
+@contextlib.contextmanager
+def _startup_phase(name):
+    """
+    Records the duration of the phase 'name' in startup_report['phases'].
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_report['phases'][name] = {
+            'start': start - _startup_clock,
+            'duration': time.perf_counter() - start}
+
+
+with _startup_phase('imports'):
+    from ari_sxn_common.ari_ophyd import M1, M1_LOCATIONS
+    from ari_sxn_common.common_ophyd import ID29EpicsSignalRO, connect_all
+    from ari_sxn_common.handlers import HDF5MemmapHandler
+    from bluesky import RunEngine
+    from bluesky.callbacks.best_effort import BestEffortCallback
+    from bluesky.plans import count, scan, grid_scan
+    from bluesky.utils import ProgressBarManager
+    from databroker import Broker
+    import json
+    import logging
+    import os
+    from ophyd.signal import EpicsSignalBase
+    from ophyd.sim import FakeEpicsSignalRO, fake_device_cache, make_fake_device
+
+simulate = bool(os.environ.get('ARI_SIMULATE'))
+startup_report['simulated'] = simulate
 
 # Create run engine
-RE = RunEngine({})
+with _startup_phase('run_engine'):
+    RE = RunEngine({})
 # Add best effort callback (tables, plotting, ...)
-bec = BestEffortCallback()
-RE.subscribe(bec)
+with _startup_phase('callbacks'):
+    bec = BestEffortCallback()
+    RE.subscribe(bec)
 # Add a temporary databroker
-db = Broker.named('temp')
-RE.subscribe(db.insert)
+with _startup_phase('databroker'):
+    db = Broker.named('temp')
+    RE.subscribe(db.insert)
+    # Read the HDF5 files written by areaDetector cameras memory-mapped
+    db.reg.register_handler('AD_HDF5', HDF5MemmapHandler, overwrite=True)
 # Add Progress bars
 RE.waiting_hook = ProgressBarManager()
 
 EpicsSignalBase.set_defaults(timeout=10, connection_timeout=10)
 
 # Setup the m1 mirror ophyd object
-m1_locations_data = {'measure': {'diag.locations': ('Out', None),
-                                 'slits.locations': ('nominal', None)},
-                     'Yag': {'diag.locations': ('YaG', None),
-                             'slits.locations': ('nominal', None)}}
-m1 = M1('ARI_M1:', name='m1', locations_data=m1_locations_data,
-        labels=('device',))
+with _startup_phase('device_construction'):
+    if simulate:
+        # make_fake_device() only knows how to fake the standard ophyd signals
+        fake_device_cache.setdefault(ID29EpicsSignalRO, FakeEpicsSignalRO)
+        m1_class = make_fake_device(M1)
+    else:
+        m1_class = M1
+    m1 = m1_class('ARI_M1:', name='m1', locations_file=M1_LOCATIONS,
+                  locations_key='m1', labels=('device',))
+
+# Build the lazy sub-devices (slits, diag, ...) and wait once for all of the
+# m1 PVs, which connect concurrently, rather than up to connection_timeout for
+# each in turn on first use, and report any failures
+with _startup_phase('connection'):
+    m1_connections = connect_all(m1, timeout=10, include_lazy=True)
+if m1_connections['failed']:
+    logging.getLogger(__name__).warning(
+        '%d m1 signals failed to connect within 10 s: %s',
+        len(m1_connections['failed']), ', '.join(m1_connections['failed']))
+
+startup_report['total'] = time.perf_counter() - _startup_clock
+startup_report['connections'] = {
+    'signals': len(m1_connections['signals']),
+    'failed': m1_connections['failed']}
+
+if os.environ.get('ARI_STARTUP_PROFILE'):
+    with open(os.environ['ARI_STARTUP_PROFILE'], 'w') as file:
+        json.dump(startup_report, file, indent=2)
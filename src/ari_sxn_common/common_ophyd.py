@@ -1,15 +1,122 @@
 from collections import defaultdict
-from ophyd import (Component, Device, EpicsMotor)
+import contextlib
+import copy
+import functools
+import html
+import operator
+from ophyd import (Component, Device, EpicsMotor, Kind)
 from ophyd.areadetector.base import ADComponent
 from ophyd.areadetector.cam import ProsilicaDetectorCam
 from ophyd.areadetector.detectors import ProsilicaDetector
+from ophyd.areadetector.filestore_mixins import FileStoreHDF5IterativeWrite
+from ophyd.areadetector.plugins import HDF5Plugin, ROIPlugin, StatsPlugin
 from ophyd.areadetector.trigger_mixins import SingleTrigger
+from ophyd.device import do_not_wait_for_lazy_connection
+from ophyd.ophydobj import OphydObject
 from ophyd.quadem import NSLS_EM, QuadEMPort
-from ophyd.signal import Signal, EpicsSignalRO, EpicsSignal
+from ophyd.signal import (Signal, SignalRO, EpicsSignalRO, EpicsSignal,
+                          InternalSignal)
+from ophyd.status import Status
+import numpy as np
+from pathlib import Path
 import re
+import threading
+import time
 
+from .analysis import ImageAnalysis, fit_gaussian_2d
+from .locations import (LocationsTable, _critical_path, _compile_locations,
+                        read_locations_file)
 
-class ID29EpicsMotor(EpicsMotor):
+# Holds the per-thread memoization cache used by location_read_cycle().
+_read_cycle = threading.local()
+# Matches the '(label)' that PrettyStr removes from the strings of children.
+_LABEL_PATTERN = re.compile(r'\(.*\)')
+
+
+@functools.lru_cache(maxsize=None)
+def _read_executor():
+    """
+    Returns the executor used to read the signals of a DeviceWithLocations.
+
+    The executor (and the concurrent.futures import) is only created the first
+    time several signals are read concurrently, not when this module is
+    imported.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    return ThreadPoolExecutor(max_workers=8,
+                              thread_name_prefix='location_read')
+
+
+@functools.lru_cache(maxsize=None)
+def _analysis_executor():
+    """
+    Returns the single worker executor used for (CPU bound) image analysis.
+
+    This keeps analysis, e.g. `Diagnostic`'s beam profile, off the I/O bound
+    `_read_executor()` so that a burst of triggers cannot delay location
+    reads, and location reads cannot delay the trigger statuses.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix='analysis')
+
+
+@functools.lru_cache(maxsize=None)
+def _display_executor():
+    """
+    Returns the executor used to read the values shown by `_repr_html_()`.
+
+    This is separate from `_read_executor()` because display reads are
+    abandoned, not waited for, after a time-out, and may read
+    `LocationSignal`s that themselves wait on the read executor. Neither can
+    then hold up, or deadlock, the location reads.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    return ThreadPoolExecutor(max_workers=4,
+                              thread_name_prefix='display_read')
+
+
+def _invalidate_str(obj):
+    """
+    Marks the cached strings of obj and its `PrettyStr` parents as stale.
+    """
+    while obj is not None:
+        if isinstance(obj, PrettyStr):
+            obj._str_cache = None
+        obj = getattr(obj, 'parent', None)
+
+
+class _InvalidatesStr():
+    """
+    A mixin that marks cached `PrettyStr` strings stale on name/label changes.
+
+    It is used by the classes whose string includes their name and label.
+    Changing either (by assigning a new name or set of labels, in-place
+    changes to the labels set are not seen) re-builds the cached string of
+    every `PrettyStr` parent the next time it is printed.
+    """
+    @property
+    def name(self):
+        return self._name
+
+    @name.setter
+    def name(self, name):
+        self._name = name
+        _invalidate_str(self)
+
+    @property
+    def _ophyd_labels_(self):
+        return self._labels
+
+    @_ophyd_labels_.setter
+    def _ophyd_labels_(self, labels):
+        self._labels = labels
+        _invalidate_str(self)
+
+
+class ID29EpicsMotor(_InvalidatesStr, EpicsMotor):
     """
     Updates ophyd.EpicsMotor so that print(EpicsMotor) returns 'name (label)'
 
@@ -39,6 +146,8 @@ class ID29EpicsMotor(EpicsMotor):
         'kind' attribute on a few attributes.
     __str__() :
         Returns self.name (self._ophyd_labels_)
+    estimate_move_time(position, start=None) :
+        Returns the estimated time, in seconds, to move to position.
     """
     def __init__(self, *args, **kwargs):
         """
@@ -48,6 +157,43 @@ class ID29EpicsMotor(EpicsMotor):
         self.user_setpoint.kind = 'normal'
         self.user_readback.kind = 'hinted'
 
+    def estimate_move_time(self, position, start=None):
+        """
+        Returns the estimated time, in seconds, to move to position.
+
+        The estimate assumes a trapezoidal velocity profile using the motor
+        record velocity (VELO) and acceleration time (ACCL), plus the settle
+        time of this positioner. Moves that are too short to reach full
+        velocity use a triangular profile instead.
+
+        Parameters
+        ----------
+        position : float
+            The position to move to.
+        start : float, optional
+            The position the move starts from, defaults to the current
+            position.
+
+        Returns
+        -------
+        move_time : float
+            The estimated move time in seconds.
+        """
+        if start is None:
+            start = self.position
+        distance = abs(position - start)
+        velocity = self.velocity.get()
+        acceleration_time = self.acceleration.get()
+        if not distance or velocity <= 0:
+            return float(self.settle_time)
+
+        if distance >= velocity * acceleration_time:  # reaches full velocity
+            move_time = distance / velocity + acceleration_time
+        else:
+            move_time = 2 * np.sqrt(distance * acceleration_time / velocity)
+
+        return float(move_time + self.settle_time)
+
     def __str__(self):
         """
         Updating the __str__ function to return the device 'name (label)'.
@@ -56,7 +202,7 @@ class ID29EpicsMotor(EpicsMotor):
         return f'{self.name} ({list(self._ophyd_labels_)[0]})'
 
 
-class ID29EpicsSignalRO(EpicsSignalRO):
+class ID29EpicsSignalRO(_InvalidatesStr, EpicsSignalRO):
     """
     Updates ophyd.EpicsSignalRO so print(EpicsSignalRO) returns 'name (label)'
 
@@ -92,57 +238,206 @@ class ID29EpicsSignalRO(EpicsSignalRO):
         return f'{self.name} ({list(self._ophyd_labels_)[0]})'
 
 
-class PrettyStr():
+class PrettyStr(_InvalidatesStr):
     """
     A class that provides a better string when using `print(PrettyStr)`
 
     This class has a custom `__str__()` method that returns a formatted string
     that includes the device name as well as child signals grouped by the
-    `signal._ophyd_labels_` list.
+    `signal._ophyd_labels_` list. Lazy child devices that have not been built
+    yet are listed by name only, so printing does not build them.
+
+    The formatted string is cached, and only re-built after the name or
+    labels of the device, or of one of its children, are assigned or a lazy
+    sub-device is built (at any depth), see `_invalidate_str()`.
+
+    In notebooks (e.g. Jupyter) the device is displayed, via `_repr_html_()`,
+    as collapsible HTML lists that only expand `_html_depth` levels of
+    sub-devices and show the current value of the displayed signals. Deeper
+    sub-devices are expanded by displaying them in turn.
 
     Parameters
     ----------
     None
 
+    Attributes
+    ----------
+    _html_depth : int
+        The number of levels, including this device, whose children are
+        listed by `_repr_html_()`.
+
     Methods
     -------
     __str__() :
         Returns a formatted string indicating it's name and all of the child
         signals grouped by their `_ophyd_labels_`.
+    _repr_html_(depth=None, timeout=0.5) :
+        Returns the HTML used to display the device in notebooks.
     """
+    _str_cache = None  # The formatted string, None if it is stale.
+    _html_depth = 2
+
     def __str__(self):
         """
         Updates the __str__() method to provide the formatted string described
         in the class definition.
         """
-        signals = defaultdict(list)
-        if hasattr(self, '_signals'):
-            for signal in self._signals.keys():
-                try:
-                    label = list(getattr(self, signal)._ophyd_labels_)[0]
-                except IndexError:
-                    label = 'unknown'
+        if self._str_cache is None:
+            name = self.name
+            signals = defaultdict(list)
+            for signal, component in getattr(self, '_sig_attrs', {}).items():
+                child = self._signals.get(signal)
+                if child is None:  # a lazy component that is not yet built.
+                    labels = component.kwargs.get('labels') or ['unknown']
+                    signals[list(labels)[0]].append(f'\n{signal}')
+                else:
+                    label = next(iter(child._ophyd_labels_), 'unknown')
+                    signals[label].append(str(child).replace(f'{name}_', ''))
+
+            parts = [f'\n{name} ({next(iter(self._ophyd_labels_), "unknown")})']
+            for label, strings in signals.items():
+                parts.append(f'\n  "{label}s":')
+                parts.extend(
+                    '    ' + _LABEL_PATTERN.sub('', string.replace('\n',
+                                                                  '\n    '))
+                    for string in strings)
+            self._str_cache = ''.join(parts)
+
+        return self._str_cache
+
+    def _repr_html_(self, depth=None, timeout=0.5):
+        """
+        Returns the HTML used to display the device in notebooks.
 
-                signals[label].append(
-                    getattr(self, signal).__str__().replace(f'{self.name}_',
-                                                            ''))
+        Only `depth` levels of sub-devices are listed, lazy sub-devices that
+        have not been built yet are listed by name only and the values of the
+        listed signals are read concurrently (on their own executor, see
+        `_display_executor()`), those that have not been read within timeout
+        (or are not connected) are shown as '...'.
 
-        try:
-            self_label = list(self._ophyd_labels_)[0]
-        except IndexError:
-            self_label = 'unknown'
+        Parameters
+        ----------
+        depth : int, optional
+            The number of levels to list the children of, defaults to
+            self._html_depth.
+        timeout : float, optional
+            The time, in seconds, to wait for the signal values.
+
+        Returns
+        -------
+        output : str
+            The device as nested HTML <details> and <ul> lists.
+        """
+        from concurrent.futures import wait
+
+        depth = self._html_depth if depth is None else depth
+        leaves = []
+        self._html_leaves(depth, leaves)
+        futures = {id(leaf): _display_executor().submit(_current_value, leaf)
+                   for leaf in leaves
+                   if getattr(leaf, 'connected', True)}
+        done, not_done = wait(futures.values(), timeout=timeout)
+        for future in not_done:  # free the workers of reads not yet started.
+            future.cancel()
+        values = {key: future.result() for key, future in futures.items()
+                  if future in done and future.exception() is None}
+
+        return self._html(self.name, depth, values, is_open=True)
+
+    def _html_children(self):
+        """
+        Yields the (label, attribute name, child or None if not yet built).
+        """
+        for signal, component in self._sig_attrs.items():
+            child = self._signals.get(signal)
+            labels = (component.kwargs.get('labels') if child is None
+                      else child._ophyd_labels_)
+            yield next(iter(labels or []), 'unknown'), signal, child
+
+    def _html_leaves(self, depth, leaves):
+        """
+        Appends the signals (or positioners) listed to depth to leaves.
+        """
+        for _, _, child in self._html_children():
+            if isinstance(child, PrettyStr):
+                if depth > 1:
+                    child._html_leaves(depth - 1, leaves)
+            elif isinstance(child, Signal) or hasattr(child, 'position'):
+                leaves.append(child)
+
+    def _html(self, title, depth, values, is_open=False):
+        """
+        Returns the HTML for self, titled title, see `self._repr_html_()`.
+        """
+        label = next(iter(self._ophyd_labels_), 'unknown')
+        heading = f'<b>{html.escape(title)}</b> ({html.escape(label)})'
+        if depth < 1:
+            return heading
+
+        groups = defaultdict(list)
+        for child_label, attr, child in self._html_children():
+            if child is None:
+                item = f'{html.escape(attr)} <i>(not built)</i>'
+            elif isinstance(child, PrettyStr):
+                item = child._html(attr, depth - 1, values)
+            elif id(child) in values:
+                item = (f'{html.escape(attr)}: '
+                        f'<code>{html.escape(values[id(child)])}</code>')
+            elif isinstance(child, Signal) or hasattr(child, 'position'):
+                item = f'{html.escape(attr)}: <code>...</code>'
+            else:
+                item = html.escape(attr)
+            groups[child_label].append(f'<li>{item}</li>')
+
+        parts = [f'<details{" open" if is_open else ""}>'
+                 f'<summary>{heading}</summary><ul>']
+        for child_label, items in groups.items():
+            parts.append(f'<li>{html.escape(child_label)}s<ul>')
+            parts.extend(items)
+            parts.append('</ul></li>')
+        parts.append('</ul></details>')
+
+        return ''.join(parts)
+
+
+def _current_value(signal):
+    """
+    Returns a short string of the current value (or position) of signal.
+    """
+    value = signal.position if hasattr(signal, 'position') else signal.get()
+    if np.ndim(value) and np.size(value) > 10:  # e.g. a camera image
+        return f'<{np.asarray(value).dtype} array {np.shape(value)}>'
 
-        output = f'\n{self.name} ({self_label})'
-        for label, names in signals.items():
-            output += f'\n  "{label}s":'
-            for name in names:
-                output += f'    {re.sub(r'\(.*\)', '', 
-                                        name.replace('\n', '\n    '))}'
+    return str(value)
 
-        return output
 
+@functools.lru_cache(maxsize=None)
+def _omit_subdevices(device_class):
+    """
+    Returns a sub-class of device_class whose sub-devices are all 'omitted'.
 
-class ID29EM(NSLS_EM):
+    The sub-device components (at every depth) are replaced by copies with
+    the 'omitted' kind, so the 'kind' is set as each sub-device is built
+    rather than by walking the device tree of every instance. device_class is
+    returned as is if its sub-devices are already 'omitted'.
+    """
+    namespace = {}
+    for attr, component in device_class._sig_attrs.items():
+        if not component.is_device:
+            continue
+        sub_class = _omit_subdevices(component.cls)
+        if sub_class is not component.cls or component.kind != Kind.omitted:
+            component = copy.copy(component)
+            component.cls = sub_class
+            component.kind = Kind.omitted
+            namespace[attr] = component
+    if not namespace:
+        return device_class
+
+    return type(device_class.__name__, (device_class,), namespace)
+
+
+class ID29EM(_InvalidatesStr, NSLS_EM):
     """
     A 29-ID specific version of the NSLS_EM quadEM device.
 
@@ -166,38 +461,96 @@ class ID29EM(NSLS_EM):
     conf : QuadEMPort
         updates the QuadEMport component of the `NSLS_EM` parent with a new
         port name.
+    _kinds : {str: Kind}
+        The 'kind' of the top level components that are not 'omitted',
+        applied once per class by `_initialize_device()`.
 
     Methods
     -------
     *methods : many
         The methods of the parent `NSLS_EM` class.
-    __init__(*args, **kwargs) :
-        Runs the parent `NSLS_EM` __init__() method and then updates the
-        'kind' attribute on a few attributes.
+    set_ports(timeout=10.0) :
+        Sets the NDArrayPort of the currents that do not already use
+        self.conf.port_name.
+    stage() :
+        Runs self.set_ports() and then the parent `NSLS_EM` stage() method.
     __str__() :
         Returns self.name (self._ophyd_labels_)
     """
     conf = Component(QuadEMPort, port_name='EM180', kind='config')
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+    # The 'kind' of the top level components, all others are 'omitted'.
+    _kinds = {**dict.fromkeys(['current1', 'current2', 'current3',
+                               'current4'], Kind.hinted),
+              **dict.fromkeys(['values_per_read', 'averaging_time',
+                               'integration_time', 'num_average',
+                               'num_acquire', 'em_range'], Kind.config)}
+
+    @classmethod
+    def _initialize_device(cls):
+        """
+        Resolves the 29-ID 'kind' of every component once, for the class.
+
+        The top level kinds are written to the class `_component_kinds`, which
+        ophyd uses when building each component, and the components with
+        sub-devices are replaced by copies whose class, see
+        `_omit_subdevices()`, builds all of its sub-devices as 'omitted'.
+        Instances therefore need no per-attribute 'kind' updates.
+        """
+        super()._initialize_device()
+        for attr, component in cls._sig_attrs.items():
+            if not component.is_device:
+                continue
+            device_class = _omit_subdevices(component.cls)
+            if device_class is not component.cls:
+                component = copy.copy(component)
+                component.cls = device_class
+                setattr(cls, attr, component)
+                cls._sig_attrs[attr] = component
+        cls._component_kinds = {attr: cls._kinds.get(attr, Kind.omitted)
+                                for attr in cls._component_kinds}
+
+    def set_ports(self, timeout=10.0):
+        """
+        Sets the NDArrayPort of each current to self.conf.port_name.
+
+        Only the currents whose NDArrayPort is not already correct are
+        written. The NDArrayPorts are read concurrently and the writes are
+        all issued before waiting for any of them to complete. This is called
+        from `self.stage()`, rather than during construction, so that
+        building the device does not block on Channel Access.
 
-        # Generate a list of signals and sub-devices for this qem
-        signals_list = [(signal.dotted_name, signal.item)
-                        for signal in self.walk_signals()
-                        if '.' not in signal.dotted_name]
-        devices_list = [(name, device)
-                        for (name, device) in self.walk_subdevices()]
-        for (name, device) in signals_list + devices_list:
-            if name in ['current1', 'current2', 'current3', 'current4']:
-                device.kind = 'hinted'  # Hint this signal for proper readback
-                device.nd_array_port.put('EM180')  # Set the correct port.
-            elif name in ['values_per_read', 'averaging_time',
-                          'integration_time', 'num_average', 'num_acquire',
-                          'em_range']:
-                device.kind = 'config'  # Set signal to 'config' for readback
-            elif hasattr(device, 'kind'):
-                device.kind = 'omitted'  # set signal to 'omitted'.
+        Parameters
+        ----------
+        timeout : float, optional
+            The time, in seconds, to wait for each write to complete.
+
+        Returns
+        -------
+        written : [str]
+            The names of the currents whose NDArrayPort was written.
+        """
+        port = self.conf.port_name.get()
+        currents = {name: getattr(self, name).nd_array_port
+                    for name, kind in self._kinds.items()
+                    if kind == Kind.hinted}
+        values = _read_executor().map(operator.methodcaller('get'),
+                                      currents.values())
+        statuses = {name: signal.set(port, timeout=timeout)
+                    for (name, signal), value in zip(currents.items(), values)
+                    if value != port}
+        for status in statuses.values():
+            status.wait(timeout=timeout)
+
+        return list(statuses)
+
+    def stage(self):
+        """
+        Sets the NDArrayPort of the currents, if needed, and then stages.
+        """
+        self.set_ports()
+
+        return super().stage()
 
     def __str__(self):
         """
@@ -207,7 +560,115 @@ class ID29EM(NSLS_EM):
         return f'{self.name} ({list(self._ophyd_labels_)[0]})'
 
 
-class Prosilica(SingleTrigger, ProsilicaDetector):
+class ImageSignal(SignalRO):
+    """
+    A read-only signal that returns the parent camera's image as an N-D array.
+
+    `self.parent.cam.array_data` returns the image as a flat 1-D array, this
+    signal returns it as a (height, width) (or (height, width, 3) for RGB)
+    array with the camera's native data type. If the flat array already has
+    that data type, as it does when read via Channel Access, the image is a
+    view of it rather than a copy. The shape and data type are read from the
+    `cam` settings, and cached while the parent camera is staged.
+
+    Unlike an `ophyd.signal.DerivedSignal` it does not subscribe to
+    `array_data`, which would monitor (and so transfer) every frame.
+
+    Parameters
+    ----------
+    *args : arguments
+        The arguments passed to the parent 'SignalRO' class
+    **kwargs : keyword arguments
+        The keyword arguments passed to the parent 'SignalRO' class
+
+    Methods
+    -------
+    *methods : many
+        The methods of the parent `SignalRO` class.
+    get(**kwargs) :
+        Returns the current image as a correctly shaped array.
+    image_format() :
+        Returns the (shape, dtype) of the image.
+    cache_format() :
+        Caches the (shape, dtype) of the image until `self.clear_format()`.
+    clear_format() :
+        Clears the cached (shape, dtype) of the image.
+    """
+    # The areaDetector NDDataType enum, in order.
+    _data_types = ('int8', 'uint8', 'int16', 'uint16', 'int32', 'uint32',
+                   'int64', 'uint64', 'float32', 'float64')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._format = None  # (shape, dtype) cached by self.cache_format()
+
+    def image_format(self):
+        """
+        Returns the (shape, dtype) of the image, cached or from the cam.
+
+        Returns
+        -------
+        shape : (int, ...)
+            The image shape, (ArraySizeZ, ArraySizeY, ArraySizeX) without the
+            unused (zero) sizes, e.g. (height, width) for mono images.
+        dtype : numpy.dtype
+            The data type of the image (from DataType).
+        """
+        if self._format is not None:
+            return self._format
+
+        cam = self.parent.cam
+        sizes = (cam.array_size.array_size_z.get(),
+                 cam.array_size.array_size_y.get(),
+                 cam.array_size.array_size_x.get())
+        data_type = cam.data_type.get()
+        if not isinstance(data_type, str):  # the enum index
+            data_type = self._data_types[data_type]
+
+        return (tuple(int(size) for size in sizes if size > 0),
+                np.dtype(data_type.lower()))
+
+    def cache_format(self):
+        """
+        Caches, and returns, the (shape, dtype) of the image.
+        """
+        self._format = None
+        self._format = self.image_format()
+
+        return self._format
+
+    def clear_format(self):
+        """
+        Clears the (shape, dtype) cached by `self.cache_format()`.
+        """
+        self._format = None
+
+    def get(self, **kwargs):
+        """
+        Returns the current image as a correctly shaped array.
+
+        Parameters
+        ----------
+        **kwargs : keyword arguments
+            kwargs passed through to self.parent.cam.array_data.get(**kwargs)
+
+        Returns
+        -------
+        image : numpy.ndarray
+            The image, a view of the array_data value if it has the native
+            data type.
+        """
+        shape, dtype = self.image_format()
+        array_data = self.parent.cam.array_data
+        # ArrayData may be longer than the image (e.g. NELM elements).
+        data = np.asarray(array_data.get(**kwargs), dtype=dtype)
+        self._readback = data[:int(np.prod(shape))].reshape(shape)
+        self._metadata['timestamp'] = array_data.timestamp
+
+        return self._readback
+
+
+class Prosilica(_InvalidatesStr, SingleTrigger, ProsilicaDetector):
     """
     Adds the `cam1.array_data` attribute required when not image saving.
 
@@ -231,6 +692,8 @@ class Prosilica(SingleTrigger, ProsilicaDetector):
         classes.
     cam : ProsilicaCam
         The cam attribute for this area-detector.
+    image : ImageSignal
+        The current image as a correctly shaped, native data type, array.
 
     Methods
     -------
@@ -240,6 +703,13 @@ class Prosilica(SingleTrigger, ProsilicaDetector):
     __init__(*args, **kwargs) :
         Runs the parent `ProsilicaDetector` __init__() method and then updates
         the 'kind' attribute on a few attributes.
+    stage() :
+        Waits for the (monitored) array counter, runs the parent stage()
+        method and then caches the image shape and data type used by
+        self.image.
+    unstage() :
+        Clears the cached image shape and data type and then runs the parent
+        unstage() method.
     __str__() :
         Returns self.name (self._ophyd_labels_)
     """
@@ -249,6 +719,31 @@ class Prosilica(SingleTrigger, ProsilicaDetector):
         self.cam.kind = 'normal'
         self.cam.array_data.kind = 'normal'
 
+    def stage(self):
+        """
+        Stages the camera and then caches the image shape and data type.
+        """
+        # Reading the array counter before triggering resolves a connection
+        # time-out error. It is monitored, so waiting for it once, here,
+        # keeps it current without a read (round trip) per trigger.
+        self.cam.array_counter.get()
+        staged = super().stage()
+        try:
+            self.image.cache_format()
+        except Exception:
+            self.unstage()
+            raise
+
+        return staged
+
+    def unstage(self):
+        """
+        Clears the cached image shape and data type and then un-stages.
+        """
+        self.image.clear_format()
+
+        return super().unstage()
+
     class ProsilicaCam(ProsilicaDetectorCam):
         """
         A `ProsillicaDetectorCam` class that adds some extra attributes
@@ -269,7 +764,7 @@ class Prosilica(SingleTrigger, ProsilicaDetector):
             An attribute that holds the array data for this camera.
         array_counter : EpicsSignal
             An attribute that is used to indicate how far through the trigger
-            process the detector is.
+            process the detector is, it is monitored (auto_monitor=True).
 
         Methods
         -------
@@ -285,16 +780,641 @@ class Prosilica(SingleTrigger, ProsilicaDetector):
         array_data = ADComponent(ID29EpicsSignalRO, "ArrayData",
                                  kind='normal')
         array_counter = ADComponent(EpicsSignal, 'ArrayCounter',
-                                    kind='config', timeout=10)
+                                    kind='config', timeout=10,
+                                    auto_monitor=True)
+
+    def __str__(self):
+        """
+        Updating the __str__ function to return 'name (label)'
+        """
+
+        return f'{self.name} ({list(self._ophyd_labels_)[0]})'
+
+    cam = Component(ProsilicaCam, "cam1:", kind='normal')
+    image = Component(ImageSignal, kind='omitted')
+
+
+class StatsProsilica(Prosilica):
+    """
+    A `Prosilica` camera that is read via its ROI1 and Stats1 plugins.
+
+    Rather than the full image (`self.cam.array_data`, which is 'omitted'),
+    reading this camera returns the total intensity, centroid and width
+    (sigma) of the image, inside the ROI1 region, calculated by the
+    areaDetector ROI and Stats plugins in the IOC. This reduces the data
+    transferred per point from a full frame to a few numbers, the full frame
+    can still be fetched on request via `self.cam.array_data.get()`.
+
+    Parameters
+    ----------
+    *args : arguments
+        The arguments passed to the parent 'Prosilica' class
+    **kwargs : keyword arguments
+        The keyword arguments passed to the parent 'Prosilica' class
+
+    Attributes
+    ----------
+    *attrs : many
+        The attributes of the parent `Prosilica` class.
+    roi1 : ROIPlugin
+        The region of interest plugin that feeds self.stats1.
+    stats1 : StatsPlugin
+        The statistics plugin, whose total, centroid and sigma signals are
+        'hinted'.
+
+    Methods
+    -------
+    *methods : many
+        The methods of the parent `Prosilica` class.
+    __init__(*args, **kwargs) :
+        Runs the parent `Prosilica` __init__() method and then updates the
+        'kind' of the image and statistics signals.
+    stage() :
+        Connects the cam -> roi1 -> stats1 plugin ports and then runs the
+        parent `Prosilica` stage() method.
+    """
+    # The self.stats1 signals that are read, all of them are 'hinted'.
+    _stats_signals = ('total', 'centroid.x', 'centroid.y', 'sigma_x',
+                      'sigma_y')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cam.array_data.kind = 'omitted'
+        self.stats1.kind = 'hinted'
+        self.stats1.read_attrs = list(self._stats_signals)
+        self.stats1.configuration_attrs = ['centroid_threshold']
+        for name in self._stats_signals:
+            operator.attrgetter(name)(self.stats1).kind = 'hinted'
+        self.stats1.stage_sigs.update([('compute_statistics', 'Yes'),
+                                       ('compute_centroid', 'Yes')])
+
+    def stage(self):
+        """
+        Connects the plugin ports, cam -> roi1 -> stats1, and stages.
+        """
+        self.roi1.stage_sigs['nd_array_port'] = self.cam.port_name.get()
+        self.stats1.stage_sigs['nd_array_port'] = self.roi1.port_name.get()
+
+        return super().stage()
+
+    roi1 = Component(ROIPlugin, 'ROI1:', kind='omitted')
+    stats1 = Component(StatsPlugin, 'Stats1:', kind='hinted')
+
+
+class HDF5FileStorePlugin(HDF5Plugin, FileStoreHDF5IterativeWrite):
+    """
+    An areaDetector HDF5 plugin that generates Resource and Datum documents.
+
+    See `ophyd.areadetector.filestore_mixins.FileStoreHDF5IterativeWrite`, the
+    files have the 'AD_HDF5' resource spec, which can be read with
+    `handlers.HDF5MemmapHandler`.
+    """
+
+
+class HDF5Prosilica(Prosilica):
+    """
+    A `Prosilica` camera that saves its images via the HDF5 file plugin.
+
+    Rather than the full image (`self.cam.array_data`, which is 'omitted')
+    being included in each event, the images are written to HDF5 files by
+    the areaDetector HDF5 plugin in the IOC and each reading is a reference
+    (Datum) to the image in the file (Resource). The images are written
+    uncompressed, one frame per chunk, so that they can be read with the
+    memory-mapped `handlers.HDF5MemmapHandler`.
+
+    Parameters
+    ----------
+    *args : arguments
+        The arguments passed to the parent 'Prosilica' class
+    write_path_template : str, optional
+        The directory, as seen by the IOC, to write the files to (strftime
+        codes are expanded), defaults to the class value ('/tmp/').
+    read_path_template : str, optional
+        The same directory as seen by the analysis, defaults to
+        write_path_template.
+    root : str, optional
+        The root of read_path_template that is recorded in the Resource
+        documents, defaults to '/'.
+    **kwargs : keyword arguments
+        The keyword arguments passed to the parent 'Prosilica' class
+
+    Attributes
+    ----------
+    *attrs : many
+        The attributes of the parent `Prosilica` class.
+    hdf5 : HDF5FileStorePlugin
+        The HDF5 file plugin, its readings are the Datum ids of the images.
+
+    Methods
+    -------
+    *methods : many
+        The methods of the parent `Prosilica` class.
+    __init__(*args, **kwargs) :
+        Runs the parent `Prosilica` __init__() method and then sets the file
+        paths, the 'kind' of the image signals and the file layout.
+    stage() :
+        Connects the cam -> hdf5 plugin port and then runs the parent
+        `Prosilica` stage() method.
+    """
+    def __init__(self, *args, write_path_template=None,
+                 read_path_template=None, root=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if write_path_template is not None:
+            self.hdf5.write_path_template = write_path_template
+        if read_path_template is not None:
+            self.hdf5.read_path_template = read_path_template
+        if root is not None:
+            self.hdf5.reg_root = root
+        self.cam.array_data.kind = 'omitted'
+        self.hdf5.kind = 'normal'
+        # Uncompressed, one frame per chunk, files can be memory-mapped.
+        self.hdf5.stage_sigs.update([('compression', 'None'),
+                                     ('num_frames_chunks', 1),
+                                     ('num_row_chunks', 0),
+                                     ('num_col_chunks', 0)])
+        self.hdf5.stage_sigs.move_to_end('capture')  # capture starts last
+
+    def stage(self):
+        """
+        Connects the plugin port, cam -> hdf5, and stages.
+        """
+        self.hdf5.stage_sigs['nd_array_port'] = self.cam.port_name.get()
+        self.hdf5.stage_sigs.move_to_end('capture')
+
+        return super().stage()
+
+    hdf5 = Component(HDF5FileStorePlugin, 'HDF1:', write_path_template='/tmp/')
+
+
+class LocationTransition():
+    """
+    Plans, runs and reports the move of a `DeviceWithLocations` to a location.
+
+    The move is split into 'legs', one for each of the collision-safe
+    intermediate locations defined for the target location in
+    `device._locations_via` followed by one for the target location itself.
+    Within each leg every axis starts moving as soon as the axes that must move
+    before it (as defined by the (before, after) pairs in
+    `device._locations_order`) have finished, which minimises the total move
+    time while respecting those constraints. Axes are started from status
+    callbacks, so no thread blocks while the move is in progress.
+
+    The predicted move time, from the `estimate_move_time(...)` method of each
+    axis (axes without one are assumed to take no time), and the actual move
+    time are recorded in `self.report` and logged once the move finishes.
+
+    Parameters
+    ----------
+    signal : DeviceWithLocations.LocationSignal
+        The locations signal of the device to move.
+    location : str
+        The name of the location to move to.
+    skip_satisfied : bool, optional
+        Overrides `signal.skip_satisfied` for this move if not None.
+
+    Attributes
+    ----------
+    device : DeviceWithLocations
+        The device being moved.
+    legs : [str]
+        The locations the device moves through, ending with location.
+    status : Status
+        The status object that finishes when the final leg finishes.
+    start_time : float or None
+        The `time.monotonic()` time at which the move started, None until
+        `self.start()` is called.
+    report : dict
+        A dictionary with the keys 'location', 'legs', 'predicted' (the
+        predicted move time), 'actual' (the actual move time, None until the
+        move has finished) and 'moves' (a list of dictionaries with the 'leg',
+        'axis', 'target', 'predicted', 'start' and 'elapsed' time of each
+        axis move, plus the 'transition' of the child device for axes that
+        are child `LocationSignal`s, otherwise None).
+
+    Methods
+    -------
+    predict() :
+        Returns the predicted move time in seconds.
+    start() :
+        Starts the move and returns self.status.
+    axes(offset=0.0) :
+        Returns the progress and timing of each axis move, including those
+        of child devices.
+    """
+    def __init__(self, signal, location, skip_satisfied=None):
+        self.device = signal.parent
+        self.legs = [*self.device._locations_via.get(location, []), location]
+        for leg in self.legs:
+            if leg not in self.device._locations_data:
+                raise KeyError(f'A call to {signal.name}.set() expected input,'
+                               f' {leg}, to be in '
+                               f'{list(self.device._locations_data.keys())}')
+        self.status = Status(signal)
+        self.report = {'location': location, 'legs': self.legs,
+                       'predicted': None, 'actual': None, 'moves': []}
+        self._signal = signal
+        self._skip_override = skip_satisfied
+        self._skip = (signal.skip_satisfied if skip_satisfied is None
+                      else skip_satisfied)
+        self._lock = threading.RLock()
+        self._plan = None
+        self._leg = None
+        self._targets = {}
+        self._pending = {}
+        self._finished = set()
+        self.start_time = None
+
+    def _leg_targets(self, leg, skip):
+        """
+        Returns a {'signal name': position} dict of the axes to move for leg.
+        """
+        location_data = self.device._locations_data[leg]
+        targets = {name: data[0] for name, data in location_data.items()}
+        if skip:  # Drop the 'axes' already at their location position.
+            table = self.device._locations_table
+            values = self._signal.snapshot(targets.keys())
+            targets = {name: position for name, position in targets.items()
+                       if table.index[leg] not in table.hits(name,
+                                                             values[name])}
+
+        return targets
+
+    def _plan_axis(self, name, position, start=None):
+        """
+        Returns the (estimated move time, child transition) for an axis move.
+
+        The child transition is the planned `LocationTransition` for axes that
+        are child `LocationSignal`s, otherwise None.
+        """
+        axis = getattr(self.device, name)
+        if isinstance(axis, DeviceWithLocations.LocationSignal):
+            child = LocationTransition(axis, position, self._skip_override)
+            return child.predict(), child
+        estimate = getattr(axis, 'estimate_move_time', None)
+
+        return (0.0 if estimate is None else
+                estimate(position, start=start)), None
+
+    def predict(self):
+        """
+        Returns the predicted move time in seconds.
+
+        The targets, estimated move times and child transitions of each leg
+        are computed once, by the first call, and are re-used by
+        `self.start()`. Only the axes of the first leg are checked against
+        skip_satisfied, the axes of the later legs are all assumed to move,
+        starting from the position they reach in the previous leg.
+
+        Returns
+        -------
+        predicted : float
+            The sum, over the legs, of the estimated time for each leg.
+        """
+        with self._lock:
+            if self._plan is None:
+                plan = []
+                predicted = 0.0
+                positions = {}
+                for i, leg in enumerate(self.legs):
+                    targets = self._leg_targets(leg, self._skip and i == 0)
+                    durations = {}
+                    children = {}
+                    for name, position in targets.items():
+                        durations[name], child = self._plan_axis(
+                            name, position, start=positions.get(name))
+                        if child is not None:
+                            children[name] = child
+                    predicted += _critical_path(
+                        durations, self.device._locations_order)[1]
+                    positions.update(targets)
+                    plan.append({'targets': targets, 'durations': durations,
+                                 'children': children})
+                self._plan = plan
+                self.report['predicted'] = predicted
+
+        return self.report['predicted']
+
+    def start(self):
+        """
+        Starts the move and returns self.status.
+
+        Returns
+        -------
+        status : Status
+            The status object that finishes when the final leg finishes.
+        """
+        with self._lock:
+            self.predict()
+            self.start_time = time.monotonic()
+            self._start_leg(0)
+
+        return self.status
+
+    def _start_leg(self, leg):
+        """
+        Starts the axes of leg that have no ordering constraints.
+        """
+        if leg == len(self.legs):  # All legs have finished.
+            self.report['actual'] = time.monotonic() - self.start_time
+            self._signal.log.info('%s moved to %s in %.3f s (predicted '
+                                  '%.3f s)', self.device.name,
+                                  self.report['location'],
+                                  self.report['actual'],
+                                  self.report['predicted'])
+            self.status.set_finished()
+            return
+
+        self._leg = leg
+        if self._skip and leg:  # The planned targets assumed every axis moves.
+            self._targets = self._leg_targets(self.legs[leg], True)
+        else:
+            self._targets = self._plan[leg]['targets']
+        self._pending = {axis: [before for before, after
+                                in self.device._locations_order
+                                if after == axis and before in self._targets]
+                         for axis in self._targets}
+        self._finished = set()
+        if self._targets:
+            self._start_ready()
+        else:  # Every axis is already in position.
+            self._start_leg(leg + 1)
+
+    def _start_ready(self):
+        """
+        Starts every pending axis whose ordering constraints are satisfied.
+        """
+        ready = [axis for axis, before in self._pending.items()
+                 if all(name in self._finished for name in before)]
+        for axis in ready:  # Remove all first as callbacks may run at once.
+            del self._pending[axis]
+        for axis in ready:
+            if self.status.done:  # An earlier axis failed to start.
+                return
+            self._start_axis(axis)
+
+    def _start_axis(self, name):
+        """
+        Starts moving the axis 'name' to its position in the current leg.
+        """
+        axis = getattr(self.device, name)
+        position = self._targets[name]
+        plan = self._plan[self._leg]
+        move = {'leg': self.legs[self._leg], 'axis': name,
+                'target': position,
+                'predicted': plan['durations'][name],
+                'start': time.monotonic() - self.start_time,
+                'elapsed': None, 'transition': None}
+        self.report['moves'].append(move)
+        try:
+            if isinstance(axis, DeviceWithLocations.LocationSignal):
+                child = plan['children'][name]
+                if self._leg and child._skip:  # planned from old positions.
+                    child = LocationTransition(axis, position,
+                                               self._skip_override)
+                axis.last_transition = move['transition'] = child
+                axis_status = child.start()
+            else:
+                axis_status = axis.set(position)
+        except Exception as exc:  # The status must always finish.
+            move['elapsed'] = (time.monotonic() - self.start_time -
+                               move['start'])
+            if not self.status.done:
+                self.status.set_exception(exc)
+            return
+        axis_status.add_callback(functools.partial(self._axis_finished, name,
+                                                   move))
+
+    def _axis_finished(self, name, move, axis_status):
+        """
+        Status callback run when an axis finishes moving.
+        """
+        with self._lock:
+            if self.status.done:
+                return
+            move['elapsed'] = (time.monotonic() - self.start_time -
+                               move['start'])
+            if not axis_status.success:
+                self.status.set_exception(axis_status.exception())
+                return
+
+            self._finished.add(name)
+            if len(self._finished) == len(self._targets):
+                self._start_leg(self._leg + 1)
+            else:
+                self._start_ready()
+
+    def axes(self, offset=0.0):
+        """
+        Returns the progress and timing of each axis move.
+
+        Axes that are child `LocationSignal`s are replaced by the axes moved
+        by the child device, so only the moves of real axes are returned.
+
+        Parameters
+        ----------
+        offset : float, optional
+            Added to each start time, used for the moves of child devices.
+
+        Returns
+        -------
+        axes : [dict]
+            A list of dictionaries with the 'device' name, 'leg', 'axis',
+            'target', 'predicted' move time, 'start' time (in seconds since
+            the move started), 'elapsed' time (so far, if still moving) and
+            'done' flag of each axis move.
+        """
+        axes = []
+        with self._lock:
+            moves = list(self.report['moves'])
+        for move in moves:
+            if move['transition'] is not None:
+                axes.extend(move['transition'].axes(offset + move['start']))
+                continue
+            done = move['elapsed'] is not None
+            elapsed = (move['elapsed'] if done else time.monotonic() -
+                       self.start_time - move['start'])
+            axes.append({'device': self.device.name, 'leg': move['leg'],
+                         'axis': move['axis'], 'target': move['target'],
+                         'predicted': move['predicted'],
+                         'start': offset + move['start'], 'elapsed': elapsed,
+                         'done': done})
+
+        return axes
+
+
+class LocationsStatus(Status):
+    """
+    A single status for several `LocationTransition`s run concurrently.
+
+    Every transition is started at once and this status finishes when all of
+    them have finished, or fails as soon as one of them fails. Unlike a chain
+    of `status & status` objects it also reports the progress and timing of
+    every underlying axis move via `self.axes()`.
+
+    Parameters
+    ----------
+    transitions : [LocationTransition]
+        The transitions to run.
+    **kwargs : keyword arguments
+        The keyword arguments passed to the parent `Status` class.
+
+    Attributes
+    ----------
+    transitions : [LocationTransition]
+        The transitions being run.
+    start_time : float or None
+        The `time.monotonic()` time at which the moves started, None until
+        `self.start()` is called.
+
+    Methods
+    -------
+    start() :
+        Starts every transition and returns self.
+    axes() :
+        Returns the progress and timing of each axis move.
+    """
+    def __init__(self, transitions, **kwargs):
+        super().__init__(**kwargs)
+        self.transitions = list(transitions)
+        self._remaining = len(self.transitions)
+        self._transitions_lock = threading.Lock()
+        self.start_time = None
+
+    def start(self):
+        """
+        Starts every transition and returns self.
+
+        Every transition is planned, see `LocationTransition.predict()`,
+        before any of them starts so that all the moves launch together. An
+        exception raised while planning or starting a transition fails this
+        status rather than being raised.
+
+        Returns
+        -------
+        status : LocationsStatus
+            This status object.
+        """
+        try:
+            for transition in self.transitions:
+                transition.predict()
+        except Exception as exc:  # Nothing has moved yet.
+            self.set_exception(exc)
+            return self
+
+        self.start_time = time.monotonic()
+        if not self.transitions:
+            self.set_finished()
+        for transition in self.transitions:
+            try:
+                transition.start().add_callback(self._transition_finished)
+            except Exception as exc:  # The status must always finish.
+                with self._transitions_lock:
+                    if not self.done:
+                        self.set_exception(exc)
+                break
+
+        return self
 
-    def __str__(self):
+    def _transition_finished(self, status):
         """
-        Updating the __str__ function to return 'name (label)'
+        Status callback run when a transition finishes.
         """
+        with self._transitions_lock:
+            if self.done:
+                return
+            if not status.success:
+                self.set_exception(status.exception())
+                return
+            self._remaining -= 1
+            if not self._remaining:
+                self.set_finished()
+
+    def axes(self):
+        """
+        Returns the progress and timing of each axis move.
 
-        return f'{self.name} ({list(self._ophyd_labels_)[0]})'
+        Returns
+        -------
+        axes : [dict]
+            See `LocationTransition.axes()`, with start times in seconds
+            since self.start() was called.
+        """
+        return [axis for transition in self.transitions
+                if transition.start_time is not None
+                for axis in transition.axes(transition.start_time -
+                                            self.start_time)]
 
-    cam = Component(ProsilicaCam, "cam1:", kind='normal')
+
+def set_locations(targets, skip_satisfied=None):
+    """
+    Moves several devices to a location each, all at the same time.
+
+    For example `set_locations({m1.slits: 'nominal', m1.diag: 'YaG'})`
+    starts the moves of every axis of both devices at once and returns a
+    single status, see `LocationsStatus`.
+
+    Parameters
+    ----------
+    targets : {DeviceWithLocations or LocationSignal: str}
+        A dictionary mapping each device (or its locations signal) to the
+        name of the location to move it to.
+    skip_satisfied : bool, optional
+        Overrides the skip_satisfied setting of every device if not None.
+
+    Returns
+    -------
+    status : LocationsStatus
+        The status that finishes when every device is in its location.
+    """
+    transitions = []
+    for target, location in targets.items():
+        signal = getattr(target, 'locations', target)
+        signal.last_transition = LocationTransition(signal, location,
+                                                    skip_satisfied)
+        transitions.append(signal.last_transition)
+
+    return LocationsStatus(transitions).start()
+
+
+def _on_child_component(name, callback, device):
+    """
+    Runs callback on the component 'name' of device once it has been built.
+    """
+    if hasattr(device, 'on_component'):
+        device.on_component(name, callback)
+    else:  # Only DeviceWithLocations devices have lazy components.
+        callback(operator.attrgetter(name)(device))
+
+
+@contextlib.contextmanager
+def location_read_cycle():
+    """
+    A context manager that memoizes `LocationSignal.get()` for a read cycle.
+
+    Inside this context each `DeviceWithLocations.LocationSignal` evaluates its
+    list of locations at most once, any later call (e.g. from a parent device
+    whose locations reference it, or from its own device's read) returns the
+    memoized list. Nested uses share the cache of the outermost context, which
+    is discarded when it exits. `DeviceWithLocations.read()`,
+    `DeviceWithLocations.read_configuration()` and `LocationSignal.get()` all
+    run inside this context, so a single `m1.read()` evaluates each nested
+    `LocationSignal` only once.
+
+    Yields
+    ------
+    cache : {LocationSignal: [str]}
+        The memoized lists of locations for the current read cycle.
+    """
+    cache = getattr(_read_cycle, 'cache', None)
+    if cache is not None:  # Already inside a read cycle.
+        yield cache
+        return
+
+    _read_cycle.cache = {}
+    try:
+        yield _read_cycle.cache
+    finally:
+        _read_cycle.cache = None
 
 
 class DeviceWithLocations(PrettyStr, Device):
@@ -313,6 +1433,13 @@ class DeviceWithLocations(PrettyStr, Device):
     It also includes the new `self.__str__()` method defined in the `PrettyStr`
     class.
 
+    Sub-devices declared with `Component(..., lazy=True)` are only built, and
+    connected, when first accessed. Any set-up of a lazy component (renaming
+    signals, changing their kind, ...) should be registered with
+    `self.on_component(...)`, rather than done in `__init__`, and links to
+    signals inside lazy components should be declared in `self._aliases`.
+    `self.wait_for_connection(all_signals=True)` builds every lazy component.
+
     Parameters
     ----------
     *args : arguments
@@ -328,6 +1455,26 @@ class DeviceWithLocations(PrettyStr, Device):
          by seeing if the 'signal name's 'current position' is within +/-
          'location precision' of 'location position'. For str or int signals
          this value is ignored but should be set as 'None'.
+    skip_satisfied : bool, optional.
+        If True, moving to a location via `self.locations.set('...')` only
+        moves the signals that are not already within +/- 'location precision'
+        of 'location position', those that are already in position are
+        skipped. Defaults to False, which moves every signal.
+    locations_order : [(str, str), ...], optional.
+        A list of ('signal name', 'signal name') pairs, when moving to a
+        location the second signal only starts moving once the first has
+        finished moving (e.g. [('blade', 'filter')] moves the blade before
+        the filter). Signals without ordering constraints move in parallel.
+    locations_via : {str: [str, ...], ...}, optional.
+        A dictionary mapping the names of 'locations' to a list of
+        collision-safe intermediate 'locations' that the device moves
+        through, in order, before moving to the 'location'.
+    locations_file : str or pathlib.Path, optional.
+        A YAML, JSON or TOML file to load the locations from, instead of
+        passing locations_data, see `self.load_locations()`.
+    locations_key : str, optional.
+        The table inside locations_file that holds the locations, see
+        `read_locations_file()`.
     **kwargs : keyword arguments
         The keyword arguments passed to the parent 'Device' class
 
@@ -337,10 +1484,24 @@ class DeviceWithLocations(PrettyStr, Device):
         The attributes of the parent `Device` and `PrettyStr` classes.
     _locations_data : Dict
         A dictionary containing the information on the locations as passed into
-        the self.__init__() method via locations_data.
+        the self.__init__() method via locations_data. Assigning a new
+        dictionary to this attribute also updates self._locations_table.
+    _locations_table : LocationsTable
+        The compiled, NumPy array based, form of self._locations_data used
+        to determine which locations the device is currently 'in'.
+    _locations_order : [(str, str), ...]
+        The ordering constraints passed in via locations_order.
+    _locations_via : {str: [str, ...], ...}
+        The intermediate locations passed in via locations_via.
+    _locations_file : (pathlib.Path, str, bytes) or None
+        The (path, key, contents) of the file the locations were last loaded
+        from, or None if they were not loaded from a file.
     locations : LocationSignal
         The signal that contains the methods used for setting and reading
         the devices location(s).
+    _aliases : {str: str}
+        A dictionary mapping attribute names to the dotted name of the signal
+        they link to, resolved (building any lazy components) on access.
 
     Methods
     -------
@@ -349,9 +1510,33 @@ class DeviceWithLocations(PrettyStr, Device):
     __init__(*args, **kwargs) :
         Runs the parent `Device` __init__() method and then adds the
         `_locations_data` attribute.
+    on_component(name, callback) :
+        Runs callback(component) once the, possibly lazy, component 'name'
+        has been built.
+    find(label, include_lazy=False) :
+        Returns every signal or sub-device, at any depth, labelled label.
+    validate_locations(locations_data) :
+        Raises a ValueError if locations_data references missing signals or
+        has invalid positions or precisions.
+    load_locations(path, key=None) :
+        Loads and validates the locations from a YAML, JSON or TOML file.
+    reload_locations() :
+        Re-loads the locations file if it has changed since it was loaded.
+    distances() :
+        Returns the normalised distance, in units of the location precision,
+        from the current position to each location.
+    nearest() :
+        Returns the (location, distance) of the location nearest to the
+        current position.
+    read() :
+        Runs the parent `Device` read() method inside a
+        `location_read_cycle()`.
+    read_configuration() :
+        Runs the parent `Device` read_configuration() method inside a
+        `location_read_cycle()`.
     """
 
-    class LocationSignal(Signal):
+    class LocationSignal(_InvalidatesStr, Signal):
         """
         An InternalSignal class to be used for updating the 'location' signal
 
@@ -369,6 +1554,13 @@ class DeviceWithLocations(PrettyStr, Device):
         It also has a self.__str__() method that returns 'name (label)' to match
         the structure.
 
+        The list of locations is tracked incrementally, the first call to
+        `self.get()` or `self.subscribe(...)` subscribes to every signal
+        referenced in `self.parent._locations_data` and each value change
+        updates only the locations that reference the changed signal. This
+        makes `self.get()` O(1) and allows value-change callbacks on this
+        signal to be used as a cheap monitored stream of the device location.
+
         NOTE: It is an inner class of DeviceWithLocations as it relies on the
         parent having attributes defined by DeviceWithLocations. It updates
         the ```self.get()``` method to update its value before calling
@@ -386,6 +1578,13 @@ class DeviceWithLocations(PrettyStr, Device):
         ----------
         *attrs : many
             The attributes of the parent `Signal` class.
+        skip_satisfied : bool
+            If True `self.set(location)` only moves the signals that are not
+            already within the location precision of their location position.
+        last_transition : LocationTransition or None
+            The `LocationTransition` started by the last call to
+            `self.set(location)`, its `report` attribute holds the predicted
+            and actual move times.
 
         Methods
         -------
@@ -395,12 +1594,33 @@ class DeviceWithLocations(PrettyStr, Device):
             Returns self.name (self._ophyd_labels_)
         get() :
             Returns a list of locations the parent device is currently 'in'.
-        set(location) :
+        set(location, skip_satisfied=None) :
             Sets the 'location' of the parent device to location.
         available() :
             returns a list of possible 'locations' that the parent device can
             be set to.
+        snapshot(signal_names=None) :
+            Returns the current value of each signal referenced in the parent's
+            locations, reading each signal only once.
+        estimate_move_time(location, start=None) :
+            Returns the predicted time, in seconds, to move to location.
+        subscribe(callback, event_type=None, run=True) :
+            Starts tracking the parent's location before subscribing callback.
+        start_tracking() :
+            Subscribes to each signal referenced in the parent's locations.
+        stop_tracking() :
+            Removes the subscriptions added by start_tracking().
         """
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._tracking = False
+            self._tracking_lock = threading.RLock()
+            self._tracking_cids = []  # (signal, cid) tuples
+            self._tracked_hits = {}  # signal name: satisfied location indices
+            self._satisfied = np.zeros(0, dtype=int)
+            self._matched = set()  # indices of the locations we are 'in'
+            self.skip_satisfied = False
+            self.last_transition = None
 
         def __str__(self):
             """
@@ -413,17 +1633,19 @@ class DeviceWithLocations(PrettyStr, Device):
             """
             Method that returns a list of 'locations' that the device is 'in'
 
-            This is a modified get method that looks through
-            self.parent._locations_data to check if the device is 'in' each of
-            the locations and then 'puts' a list of locations where this is
+            This is a modified get method that starts tracking the signals
+            referenced in self.parent._locations_data, checks, using the
+            compiled self.parent._locations_table, if the device is 'in' each
+            of the locations and then 'puts' a list of locations where this is
             true. After this it returns super().get(**kwargs) to ensure that
             any important information is not lost.
 
-            Note, the put at the end is done during the 'get' instead of during
-            the 'set' as each of the motors/signals could be independently
-            moved without passing through the 'set' function. This does result
-            in the case where using 'locations.value' does not guarantee an
-            up-to-date value so take care.
+            Note, the put is done as the referenced signals change (or during
+            the 'get' until each of them has reported a value) instead of
+            during the 'set' as each of the motors/signals could be
+            independently moved without passing through the 'set' function.
+            Within a `location_read_cycle()` the list is only evaluated on the
+            first call, later calls return the memoized list.
 
             Parameters
             ----------
@@ -435,104 +1657,280 @@ class DeviceWithLocations(PrettyStr, Device):
             super().get(**kwargs) :
                 Returns the result of super().get(**kwargs)
             """
-            # Determine the locations we are currently 'in'.
-            locations = []
-            # Note the next line gives an 'accessing a protected member,
-            # _locations_data' warning in my editor. I accept the risk !-).
-            for location, location_data in self.parent._locations_data.items():
-                value_check = []
-                for signal_name, data in location_data.items():
-                    # note below tries signal.position and then signal.get() to
-                    # work with 'positioners' and 'signals'.
-                    signal = getattr(self.parent, signal_name)
-                    # EpicsMotor.get() returns a tuple not it's position
-                    if hasattr(signal, 'position'):
-                        value = getattr(signal, 'position')
-                    elif hasattr(signal, 'get'):
-                        value = getattr(signal, 'get')()
-                    else:
-                        raise AttributeError(f'during a call to '
-                                             f'{self.parent}.locations.get() a '
-                                             f'signal ({signal_name}) from '
-                                             f'{self.parent.name}'
-                                             f'._location_data was found to not'
-                                             f' have a supported attribute. '
-                                             f'Presently supported attributes '
-                                             f'are '
-                                             f'{self.parent.name}{signal_name}.'
-                                             f'position and '
-                                             f'{self.parent.name}{signal_name}.'
-                                             f'get()')
-
-                    if isinstance(value, float):  # for float values
-                        value_check.append(data[0] - data[1] < value <
-                                           data[0] + data[1])
-                    elif isinstance(getattr(self.parent, signal_name),
-                                    type(self)):
-                        # This implies the signal is a child DeviceWithLocation
-                        # LocationSignal
-                        value_check.append(data[0] in value)
-                    elif isinstance(value, (int, str)):  # for string/int values
-                        value_check.append(data[0] == value)
-                    else:
-                        raise ValueError(f'during a call to {self.parent.name}.'
-                                         f'locations.get()'
-                                         f'a value ({value}) from '
+            with location_read_cycle() as cache:
+                if self not in cache:
+                    cache[self] = self._get(**kwargs)
+
+                return cache[self]
+
+        def _get(self, **kwargs):
+            """
+            Evaluates the list of locations, see `self.get()`.
+            """
+            table = self.parent._locations_table
+            with self._tracking_lock:
+                self.start_tracking()
+                primed = len(self._tracked_hits) == len(table.signals)
+
+            if not primed:
+                # Not every signal has reported a value via its subscription
+                # yet, so read each signal referenced in
+                # self.parent._locations_data exactly once instead.
+                values = self.snapshot()
+                with self._tracking_lock:
+                    try:
+                        for signal_name, value in values.items():
+                            if signal_name not in self._tracked_hits:
+                                self._update_hits(signal_name, value)
+                    except ValueError as exc:  # more helpful traceback message
+                        raise ValueError(f'during a call to '
+                                         f'{self.parent.name}.locations.get()'
+                                         f'a value from '
                                          f'{self.parent.name}._location_data '
                                          f'was found to be a non-supported '
                                          f'data-type. Presently supported '
                                          f'data-types are floats, ints and '
                                          f'strings or lists from '
                                          f'DeviceWithLocations '
-                                         f'LocationSignal signals')
-                if all(value_check):
-                    locations.append(location)
-
-            self.put(locations)  # Set the value at read time.
+                                         f'LocationSignal signals') from exc
+                    self._publish()
 
             return super().get(**kwargs)  # run the parent get function.
 
-        def set(self, value, **kwargs):
+        def subscribe(self, callback, event_type=None, run=True):
+            """
+            Starts tracking the parent's location and then subscribes callback
+
+            Parameters
+            ----------
+            callback : callable
+                The function to call when the event occurs, it is called with
+                the 'value' (the list of locations), 'old_value' and other
+                keyword arguments, see `ophyd.signal.Signal.subscribe`.
+            event_type : str, optional
+                The event to subscribe to, defaults to self.SUB_VALUE. Tracking
+                is only started for self.SUB_VALUE subscriptions.
+            run : bool, optional
+                If True (the default) callback is run immediately with the
+                most recent values, if there are any.
+
+            Returns
+            -------
+            cid : int
+                The id of the callback, see `ophyd.signal.Signal.subscribe`.
+            """
+            if event_type in (None, self.SUB_VALUE):
+                self.start_tracking()
+
+            return super().subscribe(callback, event_type=event_type, run=run)
+
+        def start_tracking(self):
+            """
+            Subscribes to each signal referenced in the parent's locations.
+
+            Positioners are subscribed to via their default (readback)
+            subscription and all other signals via their value subscription.
+            Each callback updates the locations that reference that signal and
+            then 'puts' the new list of locations if it has changed. This
+            method does nothing if tracking has already started.
+            """
+            with self._tracking_lock:
+                if self._tracking:
+                    return
+                self._tracking = True
+                table = self.parent._locations_table
+                self._satisfied = np.zeros(len(table.names), dtype=int)
+                self._matched = set(table.unconstrained.tolist())
+                self._tracked_hits = {}
+                for signal_name in table.signals:
+                    signal = getattr(self.parent, signal_name)
+                    cid = signal.subscribe(
+                        functools.partial(self._signal_changed, signal_name),
+                        run=True)
+                    self._tracking_cids.append((signal, cid))
+
+        def stop_tracking(self):
+            """
+            Removes the subscriptions added by `self.start_tracking()`.
+            """
+            with self._tracking_lock:
+                for signal, cid in self._tracking_cids:
+                    signal.unsubscribe(cid)
+                self._tracking = False
+                self._tracking_cids = []
+                self._tracked_hits = {}
+
+        def _signal_changed(self, signal_name, *, value=None, **kwargs):
+            """
+            Subscription callback run when a referenced signal changes value.
+            """
+            with self._tracking_lock:
+                if self._tracking:
+                    self._update_hits(signal_name, value)
+                    self._publish()
+
+        def _update_hits(self, signal_name, value):
+            """
+            Updates the satisfied location count using a new value for a signal.
+            """
+            table = self.parent._locations_table
+            hits = table.hits(signal_name, value)
+            previous_hits = self._tracked_hits.get(signal_name)
+            if previous_hits is not None:
+                self._satisfied[previous_hits] -= 1
+                changed = np.union1d(previous_hits, hits)
+            else:
+                changed = hits
+            self._satisfied[hits] += 1
+            self._tracked_hits[signal_name] = hits
+
+            # Only the locations that reference this signal can have changed.
+            matched = (self._satisfied[changed] == table.required[changed])
+            self._matched.update(changed[matched].tolist())
+            self._matched.difference_update(changed[~matched].tolist())
+
+        def _publish(self):
+            """
+            'puts' the current list of locations if it has changed.
+            """
+            table = self.parent._locations_table
+            if len(self._tracked_hits) < len(table.signals):
+                return  # not every signal has reported a value yet.
+            locations = [table.names[i] for i in sorted(self._matched)]
+            if locations != super().get():
+                self.put(locations)
+
+        def set(self, value, skip_satisfied=None, **kwargs):
             """
             A set method that moves all specified signals to a 'location'
 
             This method extracts location data using value as a key of
             the self.parent._locations_data dictionary and then uses
             this location data to move all necessary signals to their
-            desired locations.
+            desired locations, via any intermediate locations in
+            self.parent._locations_via and respecting the ordering
+            constraints in self.parent._locations_order (see
+            `LocationTransition`). If skip_satisfied is True any signal that
+            is already within the location precision of its location position
+            is not moved.
 
             Parameters
             ----------
             value : str,
                 The name of the location that the parent device should
                 be moved to.
+            skip_satisfied : bool, optional
+                Overrides `self.skip_satisfied` for this set (and any child
+                `LocationSignal` sets) if not None.
             kwargs : dict
-                The kwargs to be passed through to the super().set()
-                method.
+                Unused, accepted for compatibility with `Signal.set()`.
 
             Returns
             -------
             output_status : Status
-                The combined status object for all the required sets.
+                The status object that finishes when all the required sets
+                have finished.
             """
-            try:
-                location_data = self.parent._locations_data[value]
-            except KeyError as exc:  # more helpful traceback message
-                traceback_str = (f'A call to {self.name}.set() expected input,'
-                                 f' {value}, to be in '
-                                 f'{list(self.parent._locations_data.keys())}')
-                raise KeyError(traceback_str) from exc
+            # Move all the required 'axes' to their locations, ordering and
+            # scheduling the moves to minimise the total move time.
+            # Note super().set() is not used as it would 'put' value, rather
+            # than the list of locations, as the value of this signal.
+            self.last_transition = LocationTransition(
+                self, value, skip_satisfied=skip_satisfied)
 
-            # Move all the required 'axes' to their locations in parallel.
-            status_list = [super().set(value, **kwargs)]
-            for signal, data in location_data.items():
-                status_list.append(status_list[-1] &
-                                   getattr(self.parent, signal).set(data[0]))
+            return self.last_transition.start()
 
-            status_list[0].set_finished()  # The super().set() never completes!
-            output_status = status_list[-1]
+        def estimate_move_time(self, location, start=None):
+            """
+            Returns the predicted time, in seconds, to move to location.
+
+            Parameters
+            ----------
+            location : str
+                The name of the location to move to.
+            start : None
+                Unused, accepted to match `ID29EpicsMotor.estimate_move_time`.
+
+            Returns
+            -------
+            move_time : float
+                The predicted move time, see `LocationTransition.predict()`.
+            """
+            return LocationTransition(self, location).predict()
+
+        def snapshot(self, signal_names=None):
+            """
+            Method that reads each signal referenced by the parent's locations
+
+            Every signal referenced in self.parent._locations_data is read
+            exactly once, no matter how many locations reference it.
+            Positioners report their (monitored) 'position' and child
+            `LocationSignal`s are read directly, while any remaining signals,
+            each of which may require a Channel Access round trip, are read
+            concurrently.
+
+            Parameters
+            ----------
+            signal_names : [str], optional
+                The 'signal names' to read, defaults to every signal
+                referenced in self.parent._locations_data.
+
+            Returns
+            -------
+            values : {str: float, int, str or list}
+                A dictionary mapping each 'signal name' to its current value.
+            """
+            values = {}
+            pending = {}
+            if signal_names is None:
+                # Note the next line gives an 'accessing a protected member,
+                # _locations_table' warning in my editor. I accept the risk !-).
+                signal_names = self.parent._locations_table.signals
+            for signal_name in signal_names:
+                # note below tries signal.position and then signal.get() to
+                # work with 'positioners' and 'signals'.
+                signal = getattr(self.parent, signal_name)
+                # EpicsMotor.get() returns a tuple not it's position
+                if hasattr(signal, 'position'):
+                    values[signal_name] = getattr(signal, 'position')
+                elif hasattr(signal, 'get'):
+                    pending[signal_name] = signal
+                else:
+                    raise AttributeError(f'during a call to '
+                                         f'{self.parent}.locations.get() a '
+                                         f'signal ({signal_name}) from '
+                                         f'{self.parent.name}'
+                                         f'._location_data was found to not'
+                                         f' have a supported attribute. '
+                                         f'Presently supported attributes '
+                                         f'are '
+                                         f'{self.parent.name}{signal_name}.'
+                                         f'position and '
+                                         f'{self.parent.name}{signal_name}.'
+                                         f'get()')
+
+            # Child LocationSignals are evaluated in this thread, as they may
+            # themselves use the executor, while the other reads overlap.
+            children = {signal_name: signal
+                        for signal_name, signal in pending.items()
+                        if isinstance(signal,
+                                      DeviceWithLocations.LocationSignal)}
+            leaves = {signal_name: signal
+                      for signal_name, signal in pending.items()
+                      if signal_name not in children}
+            if len(leaves) > 1:
+                futures = {signal_name: _read_executor().submit(signal.get)
+                           for signal_name, signal in leaves.items()}
+            else:
+                futures = {}
+                values.update({signal_name: signal.get()
+                               for signal_name, signal in leaves.items()})
+            values.update({signal_name: signal.get()
+                           for signal_name, signal in children.items()})
+            values.update({signal_name: future.result()
+                           for signal_name, future in futures.items()})
 
-            return output_status
+            return values
 
         def available(self):
             """
@@ -546,22 +1944,374 @@ class DeviceWithLocations(PrettyStr, Device):
 
             return list(self.parent._locations_data.keys())
 
-    def __init__(self, *args, locations_data=None, **kwargs):
+    def __init__(self, *args, locations_data=None, skip_satisfied=False,
+                 locations_order=None, locations_via=None,
+                 locations_file=None, locations_key=None, **kwargs):
         """
         Initializes the DeviceWithLocations device class, passing *args
         and **kwargs through to parent.__init__(...) and adding some child
         class specific attributes. See the class doc-string for parameter
         descriptions.
         """
+        # Needed before super().__init__() as it builds the non-lazy components
+        self._component_callbacks = defaultdict(list)
         super().__init__(*args, **kwargs)
-        if locations_data is None:
-            locations_data = {}
-        self._locations_data = locations_data
+        self._locations_file = None
+        if locations_file is not None:
+            if locations_data is not None:
+                raise ValueError(f'{self.name} expected either locations_data '
+                                 f'or locations_file, not both')
+            self.load_locations(locations_file, key=locations_key)
+        else:
+            self._locations_data = ({} if locations_data is None
+                                    else locations_data)
+        self.locations.skip_satisfied = skip_satisfied
+        self._locations_order = list(locations_order or [])
+        self._locations_via = dict(locations_via or {})
+        # Raise early if the ordering constraints contain a cycle.
+        _critical_path({name: 0.0 for pair in self._locations_order
+                        for name in pair}, self._locations_order)
+
+    _aliases = {}
+
+    def __getattr__(self, name):
+        """
+        Resolves the links in self._aliases, see the class doc-string.
+        """
+        if name in self._aliases:
+            return operator.attrgetter(self._aliases[name])(self)
+
+        return super().__getattr__(name)
+
+    _label_index = None  # {label: [component, ...]}, built by self.find()
+    _lazy_built = False  # True once self.find() has built every component
+
+    def _instantiate_component(self, attr):
+        """
+        Builds the component 'attr' and runs any `self.on_component` callbacks.
+        """
+        component = super()._instantiate_component(attr)
+        for callback in self._component_callbacks.pop(attr, []):
+            callback(component)
+        _invalidate_str(self)
+        # Again, now that self._signals holds it, see _invalidate_labels().
+        _invalidate_labels(component)
+
+        return component
+
+    def on_component(self, name, callback):
+        """
+        Runs callback(component) once the component 'name' has been built.
+
+        The callback is run immediately if the component has already been
+        built, otherwise it is run when the (lazy) component is first
+        accessed. Callbacks are run in the order they were registered.
+
+        Parameters
+        ----------
+        name : str
+            The, possibly dotted, name of the component.
+        callback : callable
+            The function to call with the component as its only argument.
+        """
+        attr, _, rest = name.partition('.')
+        if rest:
+            callback = functools.partial(_on_child_component, rest, callback)
+        if attr in self._signals:
+            callback(self._signals[attr])
+        else:
+            self._component_callbacks[attr].append(callback)
+
+    def find(self, label, include_lazy=False):
+        """
+        Returns every signal or sub-device, at any depth, labelled label.
+
+        The components are indexed by label on the first call and later calls
+        are a dictionary look-up. The index is rebuilt after any (lazy)
+        component of this device is built, at any depth (e.g. an areaDetector
+        plugin of a camera), see `_invalidate_labels()`. Labels are read when
+        the index is built.
+
+        Parameters
+        ----------
+        label : str
+            The label (e.g. 'motor' or 'detector') to look for in the
+            `_ophyd_labels_` of each component.
+        include_lazy : bool, optional
+            If True every lazy component is built first, without waiting for
+            it to connect. Defaults to False, which skips the lazy components
+            that have not been built yet.
+
+        Returns
+        -------
+        found : [ophyd.ophydobj.OphydObject]
+            The matching components, depth first in component order.
+        """
+        if include_lazy and not self._lazy_built:
+            _build_lazy_components(self)
+            self._lazy_built = True  # components are never 'un-built'.
+        if self._label_index is None:
+            index = defaultdict(list)
+            _index_labels(self, index)
+            self._label_index = dict(index)
+
+        return list(self._label_index.get(label, []))
+
+    @property
+    def _locations_data(self):
+        """
+        The locations dictionary passed in via the locations_data kwarg.
+        """
+        return self._locations_dict
+
+    @_locations_data.setter
+    def _locations_data(self, locations_data):
+        """
+        Updates the locations dictionary and re-compiles self._locations_table.
+        """
+        self._set_locations(locations_data)
+
+    def _set_locations(self, locations_data, table=None):
+        """
+        Swaps in new locations, re-subscribing if the locations are tracked.
+
+        Parameters
+        ----------
+        locations_data : {str: {str:(float, float), ...}, ...}
+            The new locations dictionary.
+        table : LocationsTable, optional
+            The already compiled form of locations_data, compiled here if
+            not given.
+        """
+        if table is None:
+            table = LocationsTable(locations_data)
+        tracking = self.locations._tracking
+        self.locations.stop_tracking()
+        self._locations_dict = locations_data
+        self._locations_table = table
+        if tracking:  # re-subscribe and publish the new list of locations.
+            self.locations._get()
+
+    def _signal_class(self, signal_name):
+        """
+        Returns the class of the signal 'signal_name', or None if missing.
+
+        The class is found from the components of this device, so lazy
+        components are not instantiated, falling back to the attributes of
+        this device for signals added at run time.
+        """
+        cls = type(self)
+        for part in signal_name.split('.'):
+            component = getattr(cls, '_sig_attrs', {}).get(part)
+            if component is None:
+                break
+            cls = component.cls
+        else:
+            return cls
+        signal = self
+        try:
+            for part in signal_name.split('.'):
+                signal = getattr(signal, part)
+        except AttributeError:
+            return None
+
+        return type(signal)
+
+    def validate_locations(self, locations_data):
+        """
+        Checks locations_data against the components of this device.
+
+        Every 'signal name' must resolve to a signal, or positioner, of this
+        device, str positions need a precision of None and numerical
+        positions a positive precision. Only int positions of signals that are
+        not positioners may use a precision of None, as they are compared for
+        equality.
+
+        Parameters
+        ----------
+        locations_data : {str: {str:(float, float), ...}, ...}
+            The locations dictionary to check.
+
+        Raises
+        ------
+        ValueError
+            Listing every problem found in locations_data.
+        """
+        problems = []
+        for location, location_data in locations_data.items():
+            for signal_name, (position, precision) in location_data.items():
+                cls = self._signal_class(signal_name)
+                if cls is None:
+                    problems.append(f'{location}: {self.name} has no signal '
+                                    f'{signal_name}')
+                    continue
+                positioner = hasattr(cls, 'position')
+                if not (positioner or hasattr(cls, 'get')):
+                    problems.append(f'{location}: {signal_name} is not a '
+                                    f'signal or positioner')
+                numerical = (isinstance(position, (int, float)) and
+                             not isinstance(position, bool))
+                if not (numerical or isinstance(position, str)):
+                    problems.append(f'{location}: {signal_name} has a '
+                                    f'non-supported position {position!r}')
+                elif isinstance(position, str):
+                    if precision is not None:
+                        problems.append(f'{location}: {signal_name} has a '
+                                        f'str position so its precision '
+                                        f'should be None, not {precision!r}')
+                elif precision is None:
+                    if positioner or isinstance(position, float):
+                        problems.append(f'{location}: {signal_name} needs a '
+                                        f'positive precision, not None')
+                elif (isinstance(precision, bool) or
+                      not isinstance(precision, (int, float)) or
+                      not precision > 0):
+                    problems.append(f'{location}: {signal_name} needs a '
+                                    f'positive precision, not {precision!r}')
+        if problems:
+            raise ValueError(f'the locations for {self.name} are not valid:\n'
+                             + '\n'.join(problems))
+
+    def load_locations(self, path, key=None):
+        """
+        Loads the locations from a YAML, JSON or TOML file.
+
+        The file is read with `read_locations_file()` and compiled to a
+        `LocationsTable`, both of which are cached on the file contents so
+        devices loading the same unchanged file share them, and is then
+        checked with `self.validate_locations()`. The new locations replace
+        the current ones in place, see `self.reload_locations()`.
+
+        Parameters
+        ----------
+        path : str or pathlib.Path
+            The path to the file to load.
+        key : str, optional
+            The table inside the file that holds the locations, see
+            `read_locations_file()`.
+        """
+        path = Path(path)
+        contents = path.read_bytes()
+        locations_data, table = _compile_locations(contents, path, key)
+        self.validate_locations(locations_data)
+        self._set_locations(locations_data, table)
+        self._locations_file = (path, key, contents)
+
+    def reload_locations(self):
+        """
+        Re-loads the locations file if its contents have changed.
+
+        This allows the locations of a running session to be edited without
+        re-building the device, any tracking subscriptions are moved over to
+        the new locations.
+
+        Returns
+        -------
+        reloaded : bool
+            True if the file had changed and was re-loaded, otherwise False.
+        """
+        if self._locations_file is None:
+            raise ValueError(f'the locations for {self.name} were not loaded '
+                             f'from a file')
+        path, key, contents = self._locations_file
+        if path.read_bytes() == contents:
+            return False
+        self.load_locations(path, key=key)
+
+        return True
+
+    def distances(self):
+        """
+        Returns the normalised distance from the position to each location
+
+        Each signal referenced in self._locations_data is read once and the
+        distance to every location is computed in a single vectorized pass,
+        see `LocationsTable.distances` for the definition of the distance.
+        A distance less than 1 means the device is 'in' that location.
+
+        Returns
+        -------
+        distances : {str: float}
+            A dictionary mapping each location name to its distance, in units
+            of the location precision.
+        """
+        distances = self._locations_table.distances(self.locations.snapshot())
+
+        return dict(zip(self._locations_table.names, distances.tolist()))
+
+    def nearest(self):
+        """
+        Returns the location nearest to the current position.
+
+        Returns
+        -------
+        (location, distance) : (str, float) or (None, inf)
+            The name of the nearest location and its distance, see
+            `self.distances()`, or (None, inf) if no locations are defined.
+        """
+        distances = self._locations_table.distances(self.locations.snapshot())
+        if not len(distances):
+            return None, np.inf
+        nearest = int(np.argmin(distances))
+
+        return self._locations_table.names[nearest], float(distances[nearest])
+
+    def read(self):
+        """
+        Runs the parent read() inside a single `location_read_cycle()`.
+        """
+        with location_read_cycle():
+            return super().read()
+
+    def read_configuration(self):
+        """
+        Runs the parent read_configuration() inside a `location_read_cycle()`.
+        """
+        with location_read_cycle():
+            return super().read_configuration()
 
     locations = Component(LocationSignal, value=[], name='locations',
                           kind='config', labels=('position',))
 
 
+def beam_profile(image):
+    """
+    Returns the integrated intensity, centroid and RMS width of image.
+
+    The moments are calculated, in a single vectorized pass over the image,
+    from the projections of the image onto the x (column) and y (row) axes.
+    Colour images, with shape (height, width, 3), are summed over colour.
+
+    Parameters
+    ----------
+    image : numpy.ndarray
+        The (height, width) or (height, width, 3) image.
+
+    Returns
+    -------
+    profile : {str: float}
+        A dictionary with the 'intensity' (the sum of the image), the
+        centroid 'x' and 'y' and the RMS widths 'sigma_x' and 'sigma_y', all
+        in pixels. The centroid and widths are NaN if the intensity is zero.
+    """
+    image = np.asarray(image)
+    if image.ndim == 3:
+        image = image.sum(axis=2, dtype=np.float64)
+    profile_x = image.sum(axis=0, dtype=np.float64)
+    profile_y = image.sum(axis=1, dtype=np.float64)
+    intensity = profile_x.sum()
+    profile = {'intensity': float(intensity)}
+    for axis, projection in (('x', profile_x), ('y', profile_y)):
+        pixels = np.arange(len(projection), dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            centre = projection @ pixels / intensity
+            variance = projection @ (pixels - centre) ** 2 / intensity
+        profile[axis] = float(centre)
+        profile[f'sigma_{axis}'] = float(np.sqrt(variance))
+
+    return profile
+
+
 # noinspection PyUnresolvedReferences
 class Diagnostic(DeviceWithLocations):
     """
@@ -584,6 +2334,10 @@ class Diagnostic(DeviceWithLocations):
         The arguments passed to the parent 'DeviceWithLocations' class
     photodiode : bool
         A boolean indicating if the diagnostic contains a photodiode or not
+    fit_beam : bool, optional
+        A boolean indicating if a 2-D Gaussian is fitted, in worker processes,
+        to the camera image after each trigger, see the fit_* attributes.
+        Defaults to False.
     **kwargs : keyword arguments
         The keyword arguments passed to the parent 'Device' class
 
@@ -591,33 +2345,74 @@ class Diagnostic(DeviceWithLocations):
     ----------
     *attrs : many
         The attributes of the parent `DeviceWithLocations` class.
+    beam_intensity, beam_x, beam_y, beam_sigma_x, beam_sigma_y : InternalSignal
+        The integrated intensity, centroid and RMS width (in pixels) of the
+        camera image, updated, see `beam_profile()`, after each trigger.
+    fit_amplitude, fit_x, fit_y, fit_sigma_x, fit_sigma_y : InternalSignal
+        The parameters of the latest 2-D Gaussian fit, see
+        `fit_gaussian_2d()`, of the camera image (if fit_beam is True). The
+        fits finish asynchronously, trigger() does not wait for them, so a
+        reading holds the latest finished fit, which is for the image of
+        trigger number fit_frame.
+    fit_frame : InternalSignal
+        The number of the trigger (counting from 1) whose image the fit_*
+        signals are for, 0 before the first fit finishes.
+    beam_fit : ImageAnalysis or None
+        The process pool the fits are run in, None if fit_beam is False.
+        Images are skipped if it already has 'max_pending' queued, see
+        `ImageAnalysis`.
 
     Methods
     -------
     *methods : many
         The methods of the parent `DeviceWithLocations` class.
     __init__(*args, **kwargs) :
-        Runs the parent `DeviceWithLocations` __init__() method, adds some
-        symlinks to, and renames, existing attributes and then updates the
-        'kind' attribute on a few attributes.
+        Runs the parent `DeviceWithLocations` __init__() method and registers
+        the renaming, and 'kind' updates, of the lazy camera and currents
+        attributes for when they are built.
     trigger() :
         Calls the parent `DeviceWithLocations` trigger method, the child camera
         trigger method, and the child currents trigger method and returns a
-        combined status object.
+        combined status object, that also waits for the beam profile of the
+        new camera image (but not for the beam fit).
+    destroy() :
+        Shuts down the beam_fit worker processes and runs the parent
+        `DeviceWithLocations` destroy() method.
     """
-
-    def __init__(self, *args, photodiode=False, **kwargs):
+    # Whether trigger() calculates the beam_* signals from the camera image.
+    _beam_profile = True
+    # The fit_* signals, in the order of the fit_gaussian_2d() results.
+    _fit_signals = ('amplitude', 'x', 'y', 'sigma_x', 'sigma_y')
+
+    def __init__(self, *args, photodiode=False, fit_beam=False, **kwargs):
+        # Set before super().__init__() so locations can use 'photodiode'.
+        self._aliases = ({'photodiode': 'currents.current2'} if photodiode
+                         else {})
         super().__init__(*args, **kwargs)
-        # Update the 'name' of the self.camera.cam.array_data
-        getattr(self, 'camera.cam.array_data').name = f'{self.name}_camera'
+        self.on_component('camera.cam.array_data', self._name_camera)
+        self.on_component('currents', self._setup_currents)
+        self.beam_fit = ImageAnalysis(fit_gaussian_2d) if fit_beam else None
+        self._trigger_count = 0
+        if fit_beam:
+            for name in self._fit_signals + ('frame',):
+                getattr(self, f'fit_{name}').kind = 'normal'
+
+    def _name_camera(self, array_data):
+        """
+        Updates the 'name' of the self.camera.cam.array_data signal.
+        """
+        array_data.name = f'{self.name}_camera'
 
-        if photodiode:
+    def _setup_currents(self, currents):
+        """
+        Renames the photodiode current and omits the unused currents.
+        """
+        if 'photodiode' in self._aliases:
             current_signals = {'current2': 'photodiode'}
         else:
             current_signals = {}
         # the list of ```currents.current*``` attributes
         current_names = ['current1', 'current2', 'current3', 'current4']
-        currents = getattr(self, 'currents')  # ```self.currents``` attr.
 
         # for each of the current*.mean_value attrs (* = 1,2,3, or 4)
         for current_name in current_names:
@@ -625,31 +2420,125 @@ class Diagnostic(DeviceWithLocations):
             if current_name in current_signals.keys():
                 current.mean_value.name = (f'{self.name}_'
                                            f'{current_signals[current_name]}')
-                setattr(self, current_signals[current_name], current)
             else:
                 current.mean_value.kind = 'omitted'  # Omit unused currents
 
+    def _analyse_image(self, camera_status):
+        """
+        Returns a status that finishes once the camera image is analysed.
+
+        Once camera_status finishes the camera image is fetched in a worker
+        thread, see `_analysis_executor()`, rather than in the thread that
+        finished it (or the RunEngine thread). The beam_* signals are then
+        updated, if self._beam_profile, and the image is queued for the beam
+        fit, if self.beam_fit. The fit itself is not waited for. As the
+        returned status is part of the trigger status, the image is always
+        the one taken by this trigger.
+        """
+        status = Status(obj=self)
+        frame = self._trigger_count
+
+        def update():
+            try:
+                image = self.camera.image.get()
+                if self._beam_profile:
+                    for key, value in beam_profile(image).items():
+                        getattr(self, f'beam_{key}').put(value, internal=True)
+                if self.beam_fit is not None:
+                    self.beam_fit.submit(image, functools.partial(
+                        self._beam_fit_finished, frame))
+            except Exception as exc:
+                status.set_exception(exc)
+            else:
+                status.set_finished()
+
+        def camera_finished(camera_status):
+            if camera_status.success:
+                _analysis_executor().submit(update)
+            else:
+                status.set_exception(camera_status.exception() or
+                                     RuntimeError(f'{self.name} camera '
+                                                  f'trigger failed'))
+
+        camera_status.add_callback(camera_finished)
+
+        return status
+
+    def _beam_fit_finished(self, frame, future):
+        """
+        Updates the fit_* signals with the finished fit of trigger frame.
+
+        Failed fits set the fit parameters to NaN, fits that finish after a
+        later frame's fit (or were cancelled) are ignored.
+        """
+        if future.cancelled() or frame <= self.fit_frame.get():
+            return
+        if future.exception() is None:
+            fit = future.result()
+        else:
+            fit = {}
+        for name in self._fit_signals:
+            getattr(self, f'fit_{name}').put(fit.get(name, np.nan),
+                                             internal=True)
+        self.fit_frame.put(frame, internal=True)
+
+    def destroy(self):
+        """
+        Shuts down the beam_fit worker processes and destroys the device.
+        """
+        if self.beam_fit is not None:
+            self.beam_fit.close()
+        super().destroy()
+
     blade = Component(ID29EpicsMotor, 'multi_trans', name='blade',
                       kind='normal', labels=('motor',))
     filter = Component(ID29EpicsMotor, 'yag_trans', name='filter',
                        kind='normal', labels=('motor',))
 
+    # The camera and currents are only built, and connected, when first used.
     camera = Component(Prosilica, 'Camera:', name='camera', kind='normal',
-                       labels=('detector',))
+                       labels=('detector',), lazy=True)
 
     # This is added to allow for the mirror current even if no photodiode exists
     currents = Component(ID29EM, 'Currents:', name='currents',
-                         kind='normal', labels=('detector',))
+                         kind='normal', labels=('detector',), lazy=True)
+
+    # The beam profile of the camera image, updated by trigger().
+    beam_intensity = Component(InternalSignal, value=np.nan, kind='hinted',
+                               labels=('detector',))
+    beam_x = Component(InternalSignal, value=np.nan, kind='hinted',
+                       labels=('detector',))
+    beam_y = Component(InternalSignal, value=np.nan, kind='hinted',
+                       labels=('detector',))
+    beam_sigma_x = Component(InternalSignal, value=np.nan, kind='hinted',
+                             labels=('detector',))
+    beam_sigma_y = Component(InternalSignal, value=np.nan, kind='hinted',
+                             labels=('detector',))
+
+    # The 2-D Gaussian fit of the camera image, if fit_beam is True.
+    fit_amplitude = Component(InternalSignal, value=np.nan, kind='omitted',
+                              labels=('detector',))
+    fit_x = Component(InternalSignal, value=np.nan, kind='omitted',
+                      labels=('detector',))
+    fit_y = Component(InternalSignal, value=np.nan, kind='omitted',
+                      labels=('detector',))
+    fit_sigma_x = Component(InternalSignal, value=np.nan, kind='omitted',
+                            labels=('detector',))
+    fit_sigma_y = Component(InternalSignal, value=np.nan, kind='omitted',
+                            labels=('detector',))
+    fit_frame = Component(InternalSignal, value=0, kind='omitted',
+                          labels=('detector',))
 
     def trigger(self):
         """
         A trigger functions that also triggers the currents quad_em and camera
         """
 
-        # resolves a connection time-out error, but I have no idea why.
-        _ = self.camera.cam.array_counter.read()
         # trigger the child components that need it
         camera_status = self.camera.trigger()
+        self._trigger_count += 1
+        if self._beam_profile or self.beam_fit is not None:
+            camera_status = self._analyse_image(camera_status)
         currents_status = self.currents.trigger()
         # Call the parent trigger
         super_status = super().trigger()
@@ -659,6 +2548,57 @@ class Diagnostic(DeviceWithLocations):
         return output_status
 
 
+class StatsDiagnostic(Diagnostic):
+    """
+    A `Diagnostic` whose camera is read via its areaDetector Stats plugin.
+
+    The camera is a `StatsProsilica`, so reading this diagnostic returns the
+    total intensity, centroid and width (sigma) of the camera image instead of
+    the full image, which is better suited to (fast) alignment scans. The
+    full image can still be fetched via `self.camera.cam.array_data.get()`.
+
+    Parameters
+    ----------
+    *args : arguments
+        The arguments passed to the parent 'Diagnostic' class
+    **kwargs : keyword arguments
+        The keyword arguments passed to the parent 'Diagnostic' class
+
+    Attributes
+    ----------
+    *attrs : many
+        The attributes of the parent `Diagnostic` class.
+
+    Methods
+    -------
+    *methods : many
+        The methods of the parent `Diagnostic` class.
+    __init__(*args, **kwargs) :
+        Runs the parent `Diagnostic` __init__() method, omits the beam_*
+        signals (which are not calculated) and registers the renaming of the
+        camera statistics signals for when it is built.
+    """
+    # The Stats plugin calculates the profile, so the image is not fetched.
+    _beam_profile = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_component('camera.stats1', self._name_stats)
+        for name in ('intensity', 'x', 'y', 'sigma_x', 'sigma_y'):
+            getattr(self, f'beam_{name}').kind = 'omitted'
+
+    def _name_stats(self, stats1):
+        """
+        Renames the read self.camera.stats1 signals to '{name}_camera_...'.
+        """
+        for name in StatsProsilica._stats_signals:
+            signal = operator.attrgetter(name)(stats1)
+            signal.name = f'{self.name}_camera_{name.replace(".", "_")}'
+
+    camera = Component(StatsProsilica, 'Camera:', name='camera',
+                       kind='normal', labels=('detector',), lazy=True)
+
+
 class BaffleSlit(DeviceWithLocations):
     """
     A DeviceWithLocations ophyd Device used for ARI & SXN 'Baffle Slit' units.
@@ -741,3 +2681,124 @@ class BaffleSlit(DeviceWithLocations):
 
         output_status = currents_status & super_status
         return output_status
+
+
+def _build_lazy_components(device):
+    """
+    Builds every lazy component of device, without waiting for connections.
+    """
+    with do_not_wait_for_lazy_connection(device):
+        for attr in device.component_names:
+            component = getattr(device, attr)
+            if isinstance(component, Device):
+                _build_lazy_components(component)
+
+
+def _invalidate_labels(obj):
+    """
+    Clears the label index of every `DeviceWithLocations` parent of obj.
+
+    This is registered as an ophyd instantiation callback, so that it runs
+    whenever any component is built, including the lazy components of
+    devices (e.g. cameras or electrometers) that are not DeviceWithLocations.
+    """
+    device = obj._parent
+    while device is not None:
+        if isinstance(device, DeviceWithLocations):
+            device._label_index = None
+        device = device._parent
+
+
+OphydObject.add_instantiation_callback(_invalidate_labels)
+
+
+def _index_labels(device, index):
+    """
+    Adds each built component of device, at any depth, to index by label.
+    """
+    for attr in device.component_names:
+        component = device._signals.get(attr)
+        if component is None:  # a lazy component that is not yet built.
+            continue
+        for label in component._ophyd_labels_:
+            index[label].append(component)
+        if isinstance(component, Device):
+            _index_labels(component, index)
+
+
+def connect_all(device, timeout=10.0, include_lazy=False):
+    """
+    Waits, once, for every signal of device to connect and reports on them.
+
+    The Channel Access connection of each EPICS signal starts as soon as the
+    signal is built, so the signals of a device all connect concurrently.
+    This waits up to timeout for all of them together, rather than up to the
+    connection timeout for each in turn on first use, and records the time at
+    which each one connected (via its 'meta' subscription) so that slow or
+    missing PVs are easy to find.
+
+    Parameters
+    ----------
+    device : ophyd.Device
+        The device whose signals, at any depth, should be connected.
+    timeout : float, optional
+        The maximum time, in seconds, to wait for all of the signals.
+    include_lazy : bool, optional
+        If True, lazy components that have not been built yet are built (and
+        connected) too, otherwise (the default) they are left for first use.
+
+    Returns
+    -------
+    report : dict
+        A dictionary with the keys 'elapsed' (the time spent waiting),
+        'failed' (a list of the names of the signals that did not connect)
+        and 'signals' (a dictionary mapping each signal name to a dictionary
+        with its 'pvs', whether it is 'connected' and its connection
+        'latency', in seconds since this function was called, which is 0.0
+        for already connected signals and None for failed ones).
+    """
+    start = time.monotonic()
+    if include_lazy:
+        _build_lazy_components(device)
+    signals = [walk.item for walk in device.walk_signals()]
+    report = {'elapsed': None, 'failed': [], 'signals': {}}
+    pending = set()
+    condition = threading.Condition()
+
+    def connection_changed(*, obj, connected=False, **kwargs):
+        with condition:
+            if connected and obj.name in pending:
+                pending.discard(obj.name)
+                report['signals'][obj.name]['connected'] = True
+                report['signals'][obj.name]['latency'] = (time.monotonic() -
+                                                          start)
+                condition.notify()
+
+    subscriptions = []
+    with condition:
+        for signal in signals:
+            pvs = [pv for pv in (getattr(signal, 'pvname', None),
+                                 getattr(signal, 'setpoint_pvname', None))
+                   if pv is not None]
+            report['signals'][signal.name] = {'pvs': list(dict.fromkeys(pvs)),
+                                              'connected': False,
+                                              'latency': None}
+            if signal.connected:
+                report['signals'][signal.name].update(connected=True,
+                                                      latency=0.0)
+                continue
+            pending.add(signal.name)
+            subscriptions.append((signal, signal.subscribe(
+                connection_changed, event_type=signal.SUB_META, run=False)))
+            # It may have connected between the check and the subscription.
+            if signal.connected:
+                connection_changed(obj=signal, connected=True)
+        # Wait, once, for every pending signal.
+        condition.wait_for(lambda: not pending,
+                           timeout=max(0.0, start + timeout - time.monotonic()))
+        report['failed'] = sorted(pending)
+    for signal, cid in subscriptions:
+        signal.unsubscribe(cid)
+    report['elapsed'] = time.monotonic() - start
+
+    return report
@@ -0,0 +1,118 @@
+"""
+Databroker handlers for the files written by ARI & SXN detectors.
+
+Kept free of ophyd (and only importing h5py when a handler is created) so that
+analysis sessions can read the files without the control system packages.
+"""
+
+import numpy as np
+
+
+class HDF5MemmapHandler():
+    """
+    Reads the frames of 'AD_HDF5' resources by memory-mapping the file.
+
+    This is a drop-in replacement for the standard areaDetector HDF5 handler
+    (e.g. `area_detector_handlers.handlers.AreaDetectorHDF5Handler`) for files
+    written by the areaDetector HDF5 plugin. Rather than copying each frame out
+    of the file via h5py, the frames of an uncompressed dataset are returned as
+    read-only `numpy.memmap` views of the file, so they are only read from disk
+    when (and where) they are used. This works for contiguous datasets and for
+    chunked datasets whose chunks hold whole frames (e.g. when written with
+    NumFramesChunks = 1, see `HDF5Prosilica`), frames of other datasets
+    (compressed or with partial frame chunks) are read via h5py.
+
+    Register it with, e.g., ``db.reg.register_handler('AD_HDF5',
+    HDF5MemmapHandler, overwrite=True)``.
+
+    Parameters
+    ----------
+    filename : str
+        The path to the HDF5 file.
+    frame_per_point : int, optional
+        The number of frames written per datum (point), defaults to 1.
+
+    Attributes
+    ----------
+    specs : {str}
+        The resource specs this handler reads.
+
+    Methods
+    -------
+    __call__(point_number) :
+        Returns the frames of point point_number.
+    close() :
+        Closes the HDF5 file.
+    """
+    specs = {'AD_HDF5'}
+    # The dataset written by the areaDetector HDF5 plugin.
+    _dataset_path = '/entry/data/data'
+
+    def __init__(self, filename, frame_per_point=1):
+        try:
+            import h5py
+        except ImportError as exc:
+            raise ImportError('reading AD_HDF5 files requires the h5py '
+                              'package') from exc
+
+        self._filename = filename
+        self._frame_per_point = frame_per_point
+        self._file = h5py.File(filename, 'r')
+        self._dataset = self._file[self._dataset_path]
+
+        # Only unfiltered (e.g. uncompressed) data can be memory-mapped.
+        dataset = self._dataset
+        filtered = dataset.id.get_create_plist().get_nfilters() > 0
+        self._offset = None if filtered else dataset.id.get_offset()
+        if (filtered or dataset.chunks is None or
+                dataset.chunks[1:] != dataset.shape[1:]):
+            self._frames_per_chunk = None
+        else:
+            self._frames_per_chunk = dataset.chunks[0]
+
+    def __call__(self, point_number):
+        """
+        Returns the frames of point point_number.
+
+        Parameters
+        ----------
+        point_number : int
+            The point (datum) number.
+
+        Returns
+        -------
+        frames : numpy.ndarray
+            The (frame_per_point, ...) array of frames, a read-only
+            `numpy.memmap` view of the file where possible.
+        """
+        start = point_number * self._frame_per_point
+        stop = start + self._frame_per_point
+        dataset = self._dataset
+
+        if self._offset is not None:  # a contiguous dataset.
+            return self._memmap(self._offset, dataset.shape)[start:stop]
+
+        if (self._frames_per_chunk and
+                start // self._frames_per_chunk ==
+                (stop - 1) // self._frames_per_chunk):  # in a single chunk.
+            first = start - start % self._frames_per_chunk
+            info = dataset.id.get_chunk_info_by_coord(
+                (first,) + (0,) * (dataset.ndim - 1))
+            if info.byte_offset is not None:  # the chunk has been written.
+                chunk = self._memmap(info.byte_offset, dataset.chunks)
+                return chunk[start - first:stop - first]
+
+        return dataset[start:stop]
+
+    def _memmap(self, offset, shape):
+        """
+        Returns a read-only memory-map of the file at offset.
+        """
+        return np.memmap(self._filename, dtype=self._dataset.dtype, mode='r',
+                         offset=offset, shape=shape)
+
+    def close(self):
+        """
+        Closes the HDF5 file, memory-maps that have been returned stay valid.
+        """
+        self._file.close()
@@ -0,0 +1,417 @@
+"""
+Ophyd-free parsing and matching of the locations of ophyd devices.
+
+Kept separate from `common_ophyd` so that locations files can be read, checked
+and compiled (e.g. by scripts or tests) without paying for ``import ophyd``.
+"""
+
+from collections import defaultdict
+import functools
+import json
+import numpy as np
+from pathlib import Path
+
+
+class LocationsTable():
+    """
+    A compiled, NumPy array based, version of a `locations_data` dictionary.
+
+    This class converts the nested `locations_data` dictionary used by
+    `DeviceWithLocations` into a set of NumPy arrays per signal. Each set holds
+    the indices of the locations that reference the signal along with the
+    corresponding location positions and precisions. This allows every
+    location that references a signal to be checked against the current value
+    of that signal in a single vectorized comparison, rather than looping over
+    each location (and each signal in each location) in Python.
+
+    For numerical signals it also builds an interval index, the location
+    positions sorted along that signal's axis along with the largest location
+    precision. The locations satisfied by a value are then found by a binary
+    search for the window value +/- the largest precision followed by an exact
+    check of only the candidates in that window, and the candidate sets from
+    each signal are intersected. This makes determining the locations that a
+    device is 'in' sub-linear in the number of locations.
+
+    Parameters
+    ----------
+    locations_data : {str: {str:(float, float), ...}, ...}
+        A dictionary mapping the names of 'locations' to a dictionary mapping
+        the 'signal name' to a (location position, location precision) tuple
+        for the corresponding location, see `DeviceWithLocations` for details.
+
+    Attributes
+    ----------
+    names : [str]
+        The names of the locations, in the order they appear in
+        `locations_data`.
+    index : {str: int}
+        A dictionary mapping each location name to its index in `names`.
+    required : numpy.ndarray
+        The number of signals referenced by each location in `names`.
+    signals : {str: {str: numpy.ndarray, ...}, ...}
+        A dictionary mapping each 'signal name' to a dictionary of arrays with
+        the keys 'index' (the indices, in `names`, of the locations that use
+        the signal), 'centres' (the location positions), 'precisions', 'lower'
+        and 'upper' (the location precision and the location position -/+ the
+        location precision, or None if the location positions are not all
+        numbers) and 'interval', the interval index for numerical signals (or
+        None), which is a (positions, lower, upper, index, reach) tuple of the
+        above sorted by location position along with the largest location
+        precision.
+    unconstrained : numpy.ndarray
+        The indices, in `names`, of the locations that reference no signals
+        (and are therefore always satisfied).
+
+    Methods
+    -------
+    match(signal_name, value) :
+        Returns a boolean array indicating which of the locations that
+        reference signal_name are satisfied by value.
+    hits(signal_name, value) :
+        Returns the indices of the locations that reference signal_name and
+        are satisfied by value.
+    evaluate(values) :
+        Returns the list of location names that are satisfied by the
+        {'signal name': value} dictionary values.
+    distances(values) :
+        Returns the normalised distance from the {'signal name': value}
+        dictionary values to each location.
+    """
+    def __init__(self, locations_data):
+        self.names = list(locations_data.keys())
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.required = np.zeros(len(self.names), dtype=int)
+
+        # Collect the (index, position, precision) columns for each signal.
+        columns = defaultdict(lambda: ([], [], []))
+        for i, location_data in enumerate(locations_data.values()):
+            self.required[i] = len(location_data)
+            for signal_name, data in location_data.items():
+                index, centres, precisions = columns[signal_name]
+                index.append(i)
+                centres.append(data[0])
+                precisions.append(np.nan if data[1] is None else data[1])
+
+        self.signals = {}
+        for signal_name, (index, centres, precisions) in columns.items():
+            centres = np.array(centres, dtype=object)
+            column = {'index': np.array(index, dtype=int), 'centres': centres,
+                      'precisions': None, 'lower': None, 'upper': None,
+                      'interval': None}
+            # Pre-compute the tolerance window for numerical positions.
+            if all(isinstance(centre, (int, float)) and
+                   not isinstance(centre, bool) for centre in centres):
+                positions = centres.astype(float)
+                precisions = np.array(precisions, dtype=float)
+                column['precisions'] = precisions
+                column['lower'] = positions - precisions
+                column['upper'] = positions + precisions
+                # The interval index used by self.hits().
+                order = np.argsort(positions, kind='stable')
+                finite = precisions[np.isfinite(precisions)]
+                column['interval'] = (positions[order],
+                                      column['lower'][order],
+                                      column['upper'][order],
+                                      column['index'][order],
+                                      float(finite.max()) if len(finite)
+                                      else None)
+            self.signals[signal_name] = column
+
+        self.unconstrained = np.flatnonzero(self.required == 0)
+
+    def match(self, signal_name, value):
+        """
+        Checks value against every location that references signal_name.
+
+        Parameters
+        ----------
+        signal_name : str
+            The 'signal name' that value was read from.
+        value : float, int, str or list
+            The current value of the signal. Floats are checked against the
+            location position +/- precision, ints and strings must equal the
+            location position and lists (from a child
+            `DeviceWithLocations.LocationSignal`) must contain it.
+
+        Returns
+        -------
+        mask : numpy.ndarray
+            A boolean array, aligned with `self.signals[signal_name]['index']`,
+            indicating which locations are satisfied by value.
+        """
+        column = self.signals[signal_name]
+        if isinstance(value, float):  # for float values
+            if column['lower'] is None:
+                return np.zeros(len(column['index']), dtype=bool)
+            return (column['lower'] < value) & (value < column['upper'])
+        elif isinstance(value, list):  # for child LocationSignal values
+            # value is a short list of location names, so a set lookup per
+            # location is cheaper than sorting for np.isin.
+            value = set(value)
+            return np.fromiter((centre in value
+                                for centre in column['centres']),
+                               dtype=bool, count=len(column['centres']))
+        elif isinstance(value, (int, str)):  # for string/int values
+            return column['centres'] == value
+        else:
+            raise ValueError(f'a value ({value}) for the signal {signal_name} '
+                             f'was found to be a non-supported data-type.')
+
+    def hits(self, signal_name, value):
+        """
+        Returns the indices of the locations satisfied by value.
+
+        Parameters
+        ----------
+        signal_name : str
+            The 'signal name' that value was read from.
+        value : float, int, str or list
+            The current value of the signal, see `self.match`.
+
+        Returns
+        -------
+        hits : numpy.ndarray
+            The indices, in `self.names`, of the locations that reference
+            signal_name and are satisfied by value.
+        """
+        column = self.signals[signal_name]
+        if not isinstance(value, float) or column['lower'] is None:
+            return column['index'][self.match(signal_name, value)]
+        positions, lower, upper, index, reach = column['interval']
+        if reach is None:  # no location has a precision.
+            return index[:0]
+
+        # Use the interval index to find the candidate locations, those
+        # within the largest precision of value, then check only those.
+        # Note positions exactly value +/- the largest precision can not be
+        # satisfied, so one 'left' search finds both ends of the window.
+        start, stop = positions.searchsorted((value - reach, value + reach))
+        satisfied = ((lower[start:stop] < value) &
+                     (value < upper[start:stop]))
+
+        return index[start:stop][satisfied]
+
+    def evaluate(self, values):
+        """
+        Returns the list of locations satisfied by values.
+
+        Parameters
+        ----------
+        values : {str: float, int, str or list}
+            A dictionary mapping each 'signal name' in `self.signals` to its
+            current value.
+
+        Returns
+        -------
+        locations : [str]
+            The names of the locations that are satisfied by values.
+        """
+        # Intersect the satisfied locations from each signal, a location is
+        # satisfied if it is a hit for every signal that it references.
+        hits = [self.hits(signal_name, values[signal_name])
+                for signal_name in self.signals]
+        candidates, counts = np.unique(np.concatenate([self.unconstrained[:0],
+                                                       *hits]),
+                                       return_counts=True)
+        satisfied = candidates[counts == self.required[candidates]]
+        if len(self.unconstrained):
+            satisfied = np.union1d(satisfied, self.unconstrained)
+
+        return [self.names[i] for i in satisfied]
+
+    def distances(self, values):
+        """
+        Returns the normalised distance from values to each location.
+
+        The distance along each numerical signal is |value - location
+        position| / location precision, and the distance to a location is the
+        largest of these over the signals it references, so a location is
+        satisfied when its distance is less than 1. Signals that are not
+        compared numerically (strings, ints, child locations) contribute 0 if
+        they match the location and infinity if they do not.
+
+        Parameters
+        ----------
+        values : {str: float, int, str or list}
+            A dictionary mapping each 'signal name' in `self.signals` to its
+            current value.
+
+        Returns
+        -------
+        distances : numpy.ndarray
+            The distance to each location, aligned with `self.names`.
+        """
+        distances = np.zeros(len(self.names))
+        for signal_name, column in self.signals.items():
+            value = values[signal_name]
+            if isinstance(value, float) and column['lower'] is not None:
+                centres = column['centres'].astype(float)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    distance = np.abs(value - centres) / column['precisions']
+                # a missing (or zero) precision can only be an exact match.
+                distance[value == centres] = 0.0
+                distance[np.isnan(distance)] = np.inf
+            else:
+                distance = np.where(self.match(signal_name, value), 0.0,
+                                    np.inf)
+            index = column['index']
+            distances[index] = np.maximum(distances[index], distance)
+
+        return distances
+
+
+def _critical_path(durations, order):
+    """
+    Returns the earliest start time of each axis and the total move time.
+
+    Every axis starts as soon as all of the axes that must move before it
+    have finished, which (with all axes free to move in parallel) gives the
+    shortest total move time that respects the ordering constraints.
+
+    Parameters
+    ----------
+    durations : {str: float}
+        A dictionary mapping each 'signal name' to its estimated move time.
+    order : [(str, str), ...]
+        A list of (before, after) 'signal name' pairs, the 'after' signal only
+        starts moving once the 'before' signal has finished. Pairs that
+        reference a signal not in durations are ignored.
+
+    Returns
+    -------
+    starts : {str: float}
+        A dictionary mapping each 'signal name' to its earliest start time.
+    total : float
+        The estimated total move time.
+    """
+    remaining = {axis: [before for before, after in order
+                        if after == axis and before in durations]
+                 for axis in durations}
+    starts = {}
+    while remaining:
+        ready = [axis for axis, before in remaining.items()
+                 if all(name in starts for name in before)]
+        if not ready:
+            raise ValueError(f'the ordering constraints {order} contain a '
+                             f'cycle between {list(remaining)}')
+        for axis in ready:
+            starts[axis] = max((starts[name] + durations[name]
+                                for name in remaining.pop(axis)), default=0.0)
+
+    total = max((starts[axis] + durations[axis] for axis in durations),
+                default=0.0)
+
+    return starts, total
+
+
+def read_locations_file(path, key=None):
+    """
+    Reads a locations_data dictionary from a YAML, JSON or TOML file.
+
+    The file format is chosen from the file extension ('.yaml', '.yml',
+    '.json' or '.toml'). The file should contain a table mapping the names of
+    'locations' to a table mapping each 'signal name' to either a
+    [location position, location precision] pair or a single location
+    position, the latter being short-hand for [location position, None] as
+    used for str or int signals (TOML has no 'null'), e.g. in TOML:
+
+        [in]
+        top = [-12.7, 0.1]
+        bottom = [12.7, 0.1]
+
+        [measure]
+        "diag.locations" = "Out"
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        The path to the file to read.
+    key : str, optional
+        A '.' separated path to the table, inside the file, that holds the
+        locations, allowing one file to hold the locations of several
+        devices. Defaults to the top level of the file.
+
+    Returns
+    -------
+    locations_data : {str: {str:(float, float), ...}, ...}
+        The locations dictionary, see `DeviceWithLocations` for details.
+    """
+    path = Path(path)
+    return _parse_locations(path.read_bytes(), path, key)
+
+
+def _parse_locations(contents, path, key=None):
+    """
+    Parses the contents of a locations file, see `read_locations_file`.
+    """
+    suffix = path.suffix.lower()
+    if suffix in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError as exc:
+            raise ImportError(f'reading the locations file {path} requires '
+                              f'the optional PyYAML package') from exc
+        raw = yaml.safe_load(contents)
+    elif suffix == '.json':
+        raw = json.loads(contents)
+    elif suffix == '.toml':
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            import tomli as tomllib
+        raw = tomllib.loads(contents.decode())
+    else:
+        raise ValueError(f'the locations file {path} has an unsupported '
+                         f'extension, supported extensions are .yaml, .yml, '
+                         f'.json and .toml')
+
+    for part in key.split('.') if key else []:
+        if not isinstance(raw, dict) or part not in raw:
+            raise KeyError(f'the locations file {path} has no table {key}')
+        raw = raw[part]
+    if not isinstance(raw, dict):
+        raise ValueError(f'the locations in {path} (table {key}) should be '
+                         f'a table of location tables')
+
+    locations_data = {}
+    for location, location_data in raw.items():
+        if not isinstance(location_data, dict):
+            raise ValueError(f'location {location} in {path} should be a '
+                             f'table mapping signal names to positions')
+        locations_data[location] = {}
+        for signal_name, entry in location_data.items():
+            if not isinstance(entry, (list, tuple)):
+                entry = (entry, None)
+            if len(entry) != 2:
+                raise ValueError(f'{location}.{signal_name} in {path} should '
+                                 f'be a position or a [position, precision] '
+                                 f'pair, got {entry}')
+            locations_data[location][signal_name] = tuple(entry)
+
+    return locations_data
+
+
+def _compile_locations(contents, path, key=None):
+    """
+    Returns the (locations_data, LocationsTable) for a locations file.
+
+    The parsing and compiling is cached on the file contents, so devices that
+    load the same table from an unchanged file share the (read-only)
+    LocationsTable. Each call returns its own copy of locations_data, so a
+    device that edits its locations does not change those of the other
+    devices (or the cache).
+    """
+    locations_data, table = _compile_locations_cached(contents, path, key)
+
+    return ({location: dict(location_data)
+             for location, location_data in locations_data.items()}, table)
+
+
+@functools.lru_cache(maxsize=32)
+def _compile_locations_cached(contents, path, key=None):
+    """
+    Parses and compiles a locations file, see `_compile_locations`.
+    """
+    locations_data = _parse_locations(contents, path, key)
+
+    return locations_data, LocationsTable(locations_data)
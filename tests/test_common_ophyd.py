@@ -0,0 +1,857 @@
+from __future__ import annotations
+
+import importlib
+import json
+import os
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+from ophyd import Component, Device, Kind
+from ophyd.signal import Signal
+from ophyd.status import Status, WaitTimeoutError
+from ophyd.sim import (FakeEpicsSignalRO, SynAxis, fake_device_cache,
+                       make_fake_device)
+
+from ari_sxn_common import common_ophyd
+from ari_sxn_common.common_ophyd import (ID29EM, DeviceWithLocations,
+                                         ID29EpicsMotor, connect_all,
+                                         LocationsTable, _critical_path,
+                                         location_read_cycle,
+                                         read_locations_file, set_locations)
+
+
+class CountingSignal(Signal):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reads = 0
+
+    def get(self, **kwargs):
+        self.reads += 1
+        return super().get(**kwargs)
+
+
+class Holder(DeviceWithLocations):
+    x = Component(SynAxis, name='x', labels=('motor',))
+    y = Component(SynAxis, name='y', labels=('motor',))
+
+
+class Parent(DeviceWithLocations):
+    holder = Component(Holder, name='holder', labels=('device',),
+                       locations_data={'in': {'x': (0.0, 0.5),
+                                              'y': (0.0, 0.5)},
+                                       'x_in': {'x': (0.0, 0.5)},
+                                       'out': {'x': (10.0, 0.5),
+                                               'y': (-10.0, 0.5)}})
+    z = Component(SynAxis, name='z', labels=('motor',))
+
+
+@pytest.fixture
+def ari_ophyd(monkeypatch):
+    module = importlib.import_module('ari_sxn_common.ari_ophyd')
+    monkeypatch.setitem(fake_device_cache, common_ophyd.ID29EpicsSignalRO,
+                        FakeEpicsSignalRO)
+    return module
+
+
+@pytest.fixture
+def parent():
+    device = Parent('', name='parent',
+                    locations_data={
+                        'measure': {'holder.locations': ('in', None),
+                                    'z': (5.0, 0.1)},
+                        'park': {'holder.locations': ('out', None)}})
+    device.holder.x.set(0.1).wait(timeout=1)
+    device.holder.y.set(-0.2).wait(timeout=1)
+    device.z.set(5.0).wait(timeout=1)
+    return device
+
+
+def test_locations_table_evaluate():
+    table = LocationsTable({'a': {'x': (1.0, 0.1), 'mode': ('on', None)},
+                            'b': {'x': (2.0, 0.1)},
+                            'c': {}})
+    assert table.evaluate({'x': 1.05, 'mode': 'on'}) == ['a', 'c']
+    assert table.evaluate({'x': 2.0, 'mode': 'on'}) == ['b', 'c']
+    assert table.evaluate({'x': 1.05, 'mode': 'off'}) == ['c']
+    with pytest.raises(ValueError, match='non-supported'):
+        table.evaluate({'x': None, 'mode': 'on'})
+
+
+def test_locations_get(parent):
+    assert parent.holder.locations.get() == ['in', 'x_in']
+    assert parent.locations.get() == ['measure']
+
+    parent.holder.x.set(10.0).wait(timeout=1)
+    parent.holder.y.set(-10.0).wait(timeout=1)
+    assert parent.holder.locations.get() == ['out']
+    assert parent.locations.get() == ['park']
+
+
+def test_locations_data_update_recompiles(parent):
+    parent.holder._locations_data = {'home': {'x': (0.0, 0.5)}}
+    assert parent.holder.locations.get() == ['home']
+    assert parent.holder.locations.available() == ['home']
+
+
+def test_locations_get_reads_each_signal_once():
+    class Filters(DeviceWithLocations):
+        mode = Component(CountingSignal, value='a', name='mode')
+        gain = Component(CountingSignal, value=1.0, name='gain')
+
+    device = Filters('', name='filters',
+                     locations_data={f'{mode}{i}': {'mode': (mode, None),
+                                                    'gain': (i, 0.5)}
+                                     for mode in 'ab' for i in range(4)})
+    assert device.locations.get() == ['a1']
+    assert device.mode.reads == 1
+    assert device.gain.reads == 1
+
+
+def test_locations_subscription_publishes_changes(parent):
+    values = []
+    parent.locations.subscribe(lambda value, **kwargs: values.append(value))
+    parent.holder.x.set(10.0).wait(timeout=1)
+    parent.holder.y.set(-10.0).wait(timeout=1)
+    assert values == [['measure'], [], ['park']]
+    assert parent.locations.get() == ['park']
+
+
+def test_locations_set(parent):
+    status = parent.locations.set('park')
+    status.wait(timeout=1)
+    assert parent.holder.x.position == 10.0
+    assert parent.holder.locations.get() == ['out']
+    assert parent.locations.get() == ['park']
+
+
+def test_location_read_cycle_memoizes(parent):
+    with location_read_cycle():
+        first = parent.holder.locations.get()
+        parent.holder.x.set(10.0).wait(timeout=1)
+        assert parent.holder.locations.get() == first
+    assert parent.holder.locations.get() != first
+
+    configuration = parent.read_configuration()
+    assert configuration['parent_locations']['value'] == []
+
+
+def test_locations_set_skip_satisfied(parent):
+    parent.holder.locations.set('in', skip_satisfied=True).wait(timeout=1)
+    assert parent.holder.x.position == 0.1
+    assert parent.holder.y.position == -0.2
+
+    parent.holder.locations.skip_satisfied = True
+    parent.holder.x.set(3.0).wait(timeout=1)
+    parent.holder.locations.set('in').wait(timeout=1)
+    assert parent.holder.x.position == 0.0
+    assert parent.holder.y.position == -0.2
+
+    parent.holder.locations.set('in', skip_satisfied=False).wait(timeout=1)
+    assert parent.holder.y.position == 0.0
+
+
+def test_critical_path():
+    starts, total = _critical_path({'a': 1.0, 'b': 2.0, 'c': 1.0},
+                                   [('a', 'c'), ('b', 'c'), ('c', 'd')])
+    assert starts == {'a': 0.0, 'b': 0.0, 'c': 2.0}
+    assert total == 3.0
+    with pytest.raises(ValueError, match='cycle'):
+        _critical_path({'a': 1.0, 'b': 1.0}, [('a', 'b'), ('b', 'a')])
+
+
+def test_estimate_move_time():
+    motor = make_fake_device(ID29EpicsMotor)('M:', name='motor')
+    motor.user_readback.sim_put(0.0)
+    motor.velocity.sim_put(2.0)
+    motor.acceleration.sim_put(0.5)
+    assert motor.estimate_move_time(10.0) == pytest.approx(5.5)
+    assert motor.estimate_move_time(0.25) == pytest.approx(0.5)
+    assert motor.estimate_move_time(12.0, start=10.0) == pytest.approx(1.5)
+
+
+def test_locations_set_order_and_via():
+    holder = Holder('', name='holder', locations_order=[('x', 'y')],
+                    locations_via={'out': ['in']},
+                    locations_data={'in': {'x': (0.0, 0.5), 'y': (0.0, 0.5)},
+                                    'out': {'x': (10.0, 0.5),
+                                            'y': (-10.0, 0.5)}})
+    holder.x.set(3.0).wait(timeout=1)
+    holder.y.set(3.0).wait(timeout=1)
+    holder.locations.set('out').wait(timeout=1)
+
+    report = holder.locations.last_transition.report
+    assert report['legs'] == ['in', 'out']
+    assert [(move['leg'], move['axis']) for move in report['moves']] == [
+        ('in', 'x'), ('in', 'y'), ('out', 'x'), ('out', 'y')]
+    assert report['predicted'] == 0.0
+    assert report['actual'] is not None
+    assert holder.locations.get() == ['out']
+
+
+def test_locations_set_plans_once():
+    calls = []
+
+    class TimedAxis(SynAxis):
+        def estimate_move_time(self, position, start=None):
+            calls.append((self.name, position))
+            return 1.0
+
+    class Stage(DeviceWithLocations):
+        x = Component(TimedAxis, name='x')
+        y = Component(TimedAxis, name='y')
+
+    class Table(DeviceWithLocations):
+        a = Component(Stage, name='a', locations_data={
+            'm': {'x': (1.0, 0.1), 'y': (1.0, 0.1)}})
+        b = Component(Stage, name='b', locations_data={
+            'm': {'x': (2.0, 0.1), 'y': (2.0, 0.1)}})
+
+    table = Table('', name='table', locations_data={
+        'm': {'a.locations': ('m', None), 'b.locations': ('m', None)}})
+    table.locations.set('m').wait(timeout=1)
+    transition = table.locations.last_transition
+    assert len(calls) == 4
+    assert transition.report['predicted'] == 1.0
+    assert table.locations.get() == ['m']
+
+
+def test_locations_set_failure_finishes_status(parent):
+    def fail(position):
+        raise RuntimeError('set failed')
+
+    parent.holder.y.set = fail
+    status = parent.holder.locations.set('out')
+    with pytest.raises(RuntimeError, match='set failed'):
+        status.wait(timeout=1)
+    assert status.done
+    assert not status.success
+
+
+def test_locations_distances(parent):
+    assert parent.holder.distances() == pytest.approx({'in': 0.4,
+                                                       'x_in': 0.2,
+                                                       'out': 19.8})
+    assert parent.holder.nearest() == ('x_in', pytest.approx(0.2))
+    assert parent.distances() == {'measure': 0.0, 'park': float('inf')}
+
+    # a missing, or zero, precision is an exact match (and only that).
+    table = LocationsTable({'home': {'x': (1, None)}, 'zero': {'x': (2, 0)}})
+    assert table.distances({'x': 1.0}).tolist() == [0.0, np.inf]
+    assert table.distances({'x': 2.0}).tolist() == [np.inf, 0.0]
+    assert table.distances({'x': 1.5}).tolist() == [np.inf, np.inf]
+
+
+def test_locations_table_index_matches_full_scan():
+    rng = np.random.default_rng(0)
+    locations_data = {
+        f'location{i}': {axis: (float(rng.uniform(-5, 5)),
+                                float(rng.uniform(0.5, 3)))
+                         for axis in ('x', 'y', 'z') if rng.random() < 0.8}
+        for i in range(500)}
+    table = LocationsTable(locations_data)
+    for _ in range(20):
+        values = {axis: float(rng.uniform(-5, 5)) for axis in table.signals}
+        expected = [name for name, location_data in locations_data.items()
+                    if all(abs(values[axis] - position) < precision
+                           for axis, (position, precision)
+                           in location_data.items())]
+        assert table.evaluate(values) == expected
+        for axis in table.signals:
+            assert sorted(table.hits(axis, values[axis])) == list(
+                table.signals[axis]['index'][table.match(axis,
+                                                         values[axis])])
+
+
+def test_read_locations_file(tmp_path):
+    path = tmp_path / 'locations.toml'
+    path.write_text('[holder.in]\nx = [0.0, 0.5]\ny = [0.0, 0.5]\n'
+                    '[parent.park]\n"holder.locations" = "out"\n')
+    assert read_locations_file(path, key='holder') == {
+        'in': {'x': (0.0, 0.5), 'y': (0.0, 0.5)}}
+    assert read_locations_file(path, key='parent') == {
+        'park': {'holder.locations': ('out', None)}}
+    with pytest.raises(KeyError, match='no table'):
+        read_locations_file(path, key='missing')
+
+
+def test_locations_module_does_not_import_ophyd():
+    code = ('import sys, ari_sxn_common.locations; '
+            'print("ophyd" in sys.modules)')
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True,
+                            text=True, check=True)
+    assert result.stdout.strip() == 'False'
+
+
+def test_load_locations_validates_each_device(tmp_path):
+    class XOnly(DeviceWithLocations):
+        x = Component(SynAxis, name='x')
+
+    path = tmp_path / 'locations.json'
+    path.write_text(json.dumps({'in': {'x': [0.0, 0.5], 'y': [0.0, 0.5]}}))
+    holder = Holder('', name='holder', locations_file=path)
+    assert holder.locations.get() == ['in']
+    # The compiled table is shared, but every device is still validated.
+    other = Holder('', name='other', locations_file=path)
+    assert other._locations_table is holder._locations_table
+    # but not the locations, so editing one device's does not change others.
+    other._locations_data['in']['x'] = (5.0, 0.5)
+    assert holder._locations_data['in']['x'] == (0.0, 0.5)
+    assert Holder('', name='new', locations_file=path).locations.get() == [
+        'in']
+    with pytest.raises(ValueError, match='no signal y'):
+        XOnly('', name='x_only', locations_file=path)
+
+    path.write_text(json.dumps({'in': {'x': [0.0, 0.5], 'z': [0.0, 0.5]},
+                                'out': {'y': [1.0, None]},
+                                'home': {'x': 0}}))
+    with pytest.raises(ValueError, match='no signal z') as info:
+        Holder('', name='holder', locations_file=path)
+    assert 'y needs a positive precision' in str(info.value)
+    assert 'x needs a positive precision' in str(info.value)
+
+
+def test_m1_locations_file(ari_ophyd):
+    m1 = make_fake_device(ari_ophyd.M1)(
+        'ARI_M1:', name='m1', locations_file=ari_ophyd.M1_LOCATIONS,
+        locations_key='m1')
+    assert m1.slits.locations.available() == ['in', 'centre', 'nominal',
+                                              'out']
+    assert m1.diag.locations.available() == ['Out', 'YaG', 'ML250', 'ML700']
+    assert m1.locations.available() == ['measure', 'Yag']
+
+    for blade, position in (('top', 12.7), ('bottom', -12.7),
+                            ('inboard', -12.7), ('outboard', 12.7)):
+        getattr(m1.slits, blade).user_readback.sim_put(position)
+    m1.diag.blade.user_readback.sim_put(0.0)
+    m1.diag.filter.user_readback.sim_put(0.0)
+    assert m1.slits.locations.get() == ['nominal']
+    assert m1.diag.locations.get() == ['Out']
+    assert m1.locations.get() == ['measure']
+
+
+def test_reload_locations(tmp_path):
+    path = tmp_path / 'locations.json'
+    path.write_text(json.dumps({'in': {'x': [0.0, 0.5]}}))
+    holder = Holder('', name='holder', locations_file=path)
+    assert holder.locations.get() == ['in']
+    values = []
+    holder.locations.subscribe(lambda value, **kwargs: values.append(value))
+    assert holder.reload_locations() is False
+
+    path.write_text(json.dumps({'home': {'x': [0.0, 0.5]}}))
+    assert holder.reload_locations() is True
+    assert holder.locations.available() == ['home']
+    assert values == [['in'], ['home']]
+
+
+def test_set_locations(parent):
+    other = Holder('', name='other',
+                   locations_data={'in': {'x': (0.0, 0.5), 'y': (0.0, 0.5)},
+                                   'out': {'x': (10.0, 0.5),
+                                           'y': (-10.0, 0.5)}})
+    status = set_locations({parent: 'park', other.locations: 'out'})
+    status.wait(timeout=1)
+    assert parent.locations.get() == ['park']
+    assert other.locations.get() == ['out']
+
+    axes = status.axes()
+    assert sorted((axis['device'], axis['axis']) for axis in axes) == [
+        ('other', 'x'), ('other', 'y'),
+        ('parent_holder', 'x'), ('parent_holder', 'y')]
+    assert all(axis['done'] and axis['elapsed'] >= 0 for axis in axes)
+
+    with pytest.raises(KeyError):
+        set_locations({parent: 'missing', other: 'in'})
+    assert other.locations.get() == ['out']
+
+
+def test_set_locations_plans_before_moving(parent):
+    class BrokenAxis(SynAxis):
+        def estimate_move_time(self, position, start=None):
+            raise RuntimeError('no estimate')
+
+    class Broken(DeviceWithLocations):
+        x = Component(BrokenAxis, name='x')
+
+    broken = Broken('', name='broken',
+                    locations_data={'in': {'x': (1.0, 0.1)}})
+    status = set_locations({parent.holder: 'out', broken: 'in'})
+    with pytest.raises(RuntimeError, match='no estimate'):
+        status.wait(timeout=1)
+    assert parent.holder.x.position == 0.1
+    assert status.axes() == []
+
+
+def test_m1_lazy_sub_devices(ari_ophyd):
+    m1 = make_fake_device(ari_ophyd.M1)('ARI_M1:', name='m1')
+    assert not {'slits', 'diag'} & set(m1._signals)
+    assert 'diag' in str(m1)
+    assert 'diag' not in m1._signals
+
+    assert m1.photocurrent is m1.diag.currents.current1.mean_value
+    assert m1.photocurrent.name == 'm1_photocurrent'
+    assert m1.photocurrent.kind == Kind.hinted
+    assert m1.diag.currents.current2.mean_value.kind == Kind.omitted
+    assert 'camera' not in m1.diag._signals
+    assert m1.diag.camera.cam.array_data.name == 'm1_diag_camera'
+
+
+def test_diagnostic_photodiode(ari_ophyd):
+    diag = make_fake_device(ari_ophyd.Diagnostic)('D:', name='diag',
+                                                  photodiode=True)
+    assert 'currents' not in diag._signals
+    assert diag.photodiode is diag.currents.current2
+    assert diag.photodiode.mean_value.name == 'diag_photodiode'
+    assert diag.currents.current1.mean_value.kind == Kind.omitted
+
+
+def test_pretty_str_cache(ari_ophyd, monkeypatch):
+    m1 = make_fake_device(ari_ophyd.M1)('ARI_M1:', name='m1',
+                                        labels=('device',))
+    first = str(m1)
+    assert str(m1) is first
+    assert first.startswith('\nm1 (device)\n  "positions":    locations')
+
+    m1.diag.camera  # building a lazy sub-device changes the structure
+    assert 'detectors":    camera' in str(m1)
+    m1.x.name = 'm1_x_renamed'
+    assert '     x_renamed ' in str(m1)
+    m1._ophyd_labels_ = set()
+    assert str(m1).startswith('\nm1 (unknown)')
+
+    # The cache is re-built only after a change, not by every call.
+    first = str(m1)
+    with monkeypatch.context() as patch:
+        patch.setattr(type(m1.diag), '__str__',
+                      lambda self: pytest.fail('re-built'))
+        assert str(m1) is first
+    m1.diag.blade.name = 'm1_diag_blade_renamed'
+    assert 'blade_renamed' in str(m1)
+
+
+def test_stats_diagnostic(monkeypatch):
+    monkeypatch.setitem(fake_device_cache, common_ophyd.ID29EpicsSignalRO,
+                        FakeEpicsSignalRO)
+    diag = make_fake_device(common_ophyd.StatsDiagnostic)('D:', name='diag')
+    camera = diag.camera
+    assert camera.hints == {'fields': ['diag_camera_centroid_x',
+                                       'diag_camera_centroid_y',
+                                       'diag_camera_sigma_x',
+                                       'diag_camera_sigma_y',
+                                       'diag_camera_total']}
+    assert camera.cam.array_data.kind == Kind.omitted
+    assert sorted(camera.read()) == sorted(camera.hints['fields'])
+    assert camera.stats1.stage_sigs['compute_centroid'] == 'Yes'
+
+
+def test_prosilica_image(monkeypatch):
+    monkeypatch.setitem(fake_device_cache, common_ophyd.ID29EpicsSignalRO,
+                        FakeEpicsSignalRO)
+    camera = make_fake_device(common_ophyd.Prosilica)('C:', name='camera')
+    camera.cam.array_size.array_size_z.sim_put(0)
+    camera.cam.array_size.array_size_y.sim_put(3)
+    camera.cam.array_size.array_size_x.sim_put(4)
+    camera.cam.data_type.sim_put('UInt16')
+    camera.cam.array_data.sim_put(np.arange(20, dtype=np.uint16))
+
+    image = camera.image.get()
+    assert image.shape == (3, 4)
+    assert image.dtype == np.uint16
+    assert np.shares_memory(image, camera.cam.array_data.get())
+    assert camera.image.kind == Kind.omitted
+
+    assert camera.image.cache_format() == ((3, 4), np.dtype('uint16'))
+    camera.cam.array_size.array_size_y.sim_put(2)
+    assert camera.image.get().shape == (3, 4)
+    camera.image.clear_format()
+    camera.cam.data_type.sim_put(1)  # the 'UInt8' enum index
+    assert camera.image.image_format() == ((2, 4), np.dtype('uint8'))
+
+
+def test_diagnostic_trigger_does_not_read_array_counter(monkeypatch):
+    monkeypatch.setitem(fake_device_cache, common_ophyd.ID29EpicsSignalRO,
+                        FakeEpicsSignalRO)
+    assert common_ophyd.Prosilica.ProsilicaCam.array_counter.kwargs[
+        'auto_monitor']
+    diag = make_fake_device(common_ophyd.Diagnostic)('D:', name='diag')
+    diag._beam_profile = False
+
+    def finished():
+        status = Status()
+        status.set_finished()
+        return status
+
+    def read():
+        raise AssertionError('array_counter read during trigger')
+
+    monkeypatch.setattr(diag.camera, 'trigger', finished)
+    monkeypatch.setattr(diag.currents, 'trigger', finished)
+    monkeypatch.setattr(diag.camera.cam.array_counter, 'read', read)
+    monkeypatch.setattr(diag.camera.cam.array_counter, 'get', read)
+    diag.trigger().wait(timeout=1)
+
+
+def test_beam_profile():
+    y, x = np.mgrid[0:60, 0:80]
+    image = np.exp(-((x - 30.0) ** 2 / (2 * 4.0 ** 2) +
+                     (y - 20.0) ** 2 / (2 * 2.0 ** 2)))
+    profile = common_ophyd.beam_profile(image)
+    assert profile['intensity'] == pytest.approx(image.sum())
+    assert profile['x'] == pytest.approx(30.0)
+    assert profile['y'] == pytest.approx(20.0)
+    assert profile['sigma_x'] == pytest.approx(4.0)
+    assert profile['sigma_y'] == pytest.approx(2.0)
+
+    rgb = common_ophyd.beam_profile(np.repeat(image[..., None], 3, axis=2))
+    assert rgb['x'] == pytest.approx(30.0)
+    assert rgb['intensity'] == pytest.approx(3 * image.sum())
+    assert np.isnan(common_ophyd.beam_profile(np.zeros((4, 4)))['x'])
+
+
+def test_diagnostic_beam_profile(monkeypatch):
+    monkeypatch.setitem(fake_device_cache, common_ophyd.ID29EpicsSignalRO,
+                        FakeEpicsSignalRO)
+    diag = make_fake_device(common_ophyd.Diagnostic)('D:', name='diag')
+    assert 'diag_beam_x' in diag.hints['fields']
+    camera = diag.camera
+    camera.cam.array_size.array_size_z.sim_put(0)
+    camera.cam.array_size.array_size_y.sim_put(2)
+    camera.cam.array_size.array_size_x.sim_put(3)
+    camera.cam.data_type.sim_put('UInt8')
+    camera.cam.array_data.sim_put(np.array([0, 0, 0, 0, 4, 4],
+                                           dtype=np.uint8))
+
+    camera_status = Status()
+    status = diag._analyse_image(camera_status)
+    assert not status.done
+    camera_status.set_finished()
+    status.wait(timeout=1)
+    assert diag.beam_intensity.get() == 8.0
+    assert diag.beam_x.get() == 1.5
+    assert diag.beam_y.get() == 1.0
+    assert diag.beam_sigma_y.get() == 0.0
+
+    failed = Status()
+    status = diag._analyse_image(failed)
+    failed.set_exception(RuntimeError('no image'))
+    with pytest.raises(RuntimeError, match='no image'):
+        status.wait(timeout=1)
+
+    stats_diag = make_fake_device(common_ophyd.StatsDiagnostic)('D:',
+                                                                name='stats')
+    assert 'beam_x' not in stats_diag.read_attrs
+    assert 'beam_x' in diag.read_attrs
+
+
+def test_fit_gaussian_2d():
+    from ari_sxn_common.analysis import fit_gaussian_2d
+
+    y, x = np.mgrid[0:60, 0:80]
+    image = 5 + 100 * np.exp(-((x - 30.5) ** 2 / (2 * 4.0 ** 2) +
+                               (y - 20.0) ** 2 / (2 * 2.0 ** 2)))
+    fit = fit_gaussian_2d(image)
+    assert fit['amplitude'] == pytest.approx(100.0, rel=1e-3)
+    assert fit['x'] == pytest.approx(30.5)
+    assert fit['y'] == pytest.approx(20.0)
+    assert fit['sigma_x'] == pytest.approx(4.0, rel=1e-3)
+    assert fit['sigma_y'] == pytest.approx(2.0, rel=1e-3)
+    assert np.isnan(fit_gaussian_2d(np.zeros((4, 4)))['x'])
+
+
+def test_image_analysis():
+    from ari_sxn_common.analysis import ImageAnalysis, fit_gaussian_2d
+
+    y, x = np.mgrid[0:20, 0:30]
+    image = np.exp(-((x - 12.0) ** 2 + (y - 8.0) ** 2) / 8)
+    analysis = ImageAnalysis(fit_gaussian_2d, max_pending=1, max_workers=1)
+    finished = threading.Event()
+    results = []
+
+    def callback(future):
+        results.append(future.result())
+        finished.set()
+
+    class BrokenPool():
+        def submit(self, *args):
+            from concurrent.futures.process import BrokenProcessPool
+
+            raise BrokenProcessPool('a worker died')
+
+    # A broken pool drops the image, frees its slot and is replaced.
+    analysis._executor = BrokenPool()
+    assert not analysis.submit(image, callback)
+    assert analysis._executor is None
+
+    try:
+        assert analysis.submit(image, callback)
+        # The queue is full, so the image is dropped rather than waiting.
+        assert not analysis.submit(image, callback)
+        assert analysis.dropped == 2
+        assert finished.wait(timeout=60)
+        assert results[0]['x'] == pytest.approx(12.0)
+    finally:
+        analysis.close()
+
+
+def test_diagnostic_beam_fit(monkeypatch):
+    from concurrent.futures import Future
+
+    monkeypatch.setitem(fake_device_cache, common_ophyd.ID29EpicsSignalRO,
+                        FakeEpicsSignalRO)
+    diag_class = make_fake_device(common_ophyd.Diagnostic)
+    assert diag_class('D:', name='diag').beam_fit is None
+    diag = diag_class('D:', name='diag', fit_beam=True)
+    assert 'fit_x' in diag.read_attrs and 'fit_frame' in diag.read_attrs
+
+    def finished(frame, result=None, exception=None):
+        future = Future()
+        if exception is None:
+            future.set_result(result)
+        else:
+            future.set_exception(exception)
+        diag._beam_fit_finished(frame, future)
+
+    finished(2, {'amplitude': 1.0, 'x': 3.0, 'y': 4.0, 'sigma_x': 5.0,
+                 'sigma_y': 6.0})
+    assert diag.fit_x.get() == 3.0 and diag.fit_frame.get() == 2
+    finished(1, {'x': 7.0})  # an older frame's fit is ignored.
+    assert diag.fit_x.get() == 3.0
+    finished(3, exception=RuntimeError('fit failed'))
+    assert np.isnan(diag.fit_x.get()) and diag.fit_frame.get() == 3
+
+    # The image is fetched, and queued, as part of the trigger status.
+    y, x = np.mgrid[0:20, 0:30]
+    camera = diag.camera
+    camera.cam.array_size.array_size_z.sim_put(0)
+    camera.cam.array_size.array_size_y.sim_put(20)
+    camera.cam.array_size.array_size_x.sim_put(30)
+    camera.cam.data_type.sim_put('Float64')
+    camera.cam.array_data.sim_put(
+        np.exp(-((x - 12.0) ** 2 + (y - 8.0) ** 2) / 8).ravel())
+    camera_status = Status()
+    camera_status.set_finished()
+    diag._trigger_count = 4
+    diag._analyse_image(camera_status).wait(timeout=5)
+    assert diag.beam_x.get() == pytest.approx(12.0)
+    for _ in range(600):
+        if diag.fit_frame.get() == 4:
+            break
+        threading.Event().wait(0.1)
+    assert diag.fit_frame.get() == 4
+    assert diag.fit_x.get() == pytest.approx(12.0)
+    diag.destroy()
+
+
+def test_hdf5_prosilica(monkeypatch):
+    monkeypatch.setitem(fake_device_cache, common_ophyd.ID29EpicsSignalRO,
+                        FakeEpicsSignalRO)
+    camera = make_fake_device(common_ophyd.HDF5Prosilica)(
+        'C:', name='camera', write_path_template='/data/',
+        read_path_template='/mnt/data/', root='/mnt')
+    assert camera.read_attrs == ['cam', 'hdf5']
+    assert camera.cam.array_data.kind == Kind.omitted
+    assert camera.hdf5.filestore_spec == 'AD_HDF5'
+    assert camera.hdf5.read_path_template == '/mnt/data/'
+    assert list(camera.hdf5.stage_sigs)[-1] == 'capture'
+    assert camera.hdf5.stage_sigs['compression'] == 'None'
+
+
+def test_hdf5_memmap_handler(tmp_path):
+    h5py = pytest.importorskip('h5py')
+    from ari_sxn_common.handlers import HDF5MemmapHandler
+
+    frames = np.arange(4 * 3 * 2, dtype=np.uint16).reshape(4, 3, 2)
+    path = tmp_path / 'frames.h5'
+    with h5py.File(path, 'w') as file:
+        file.create_dataset('entry/data/data', data=frames, chunks=(1, 3, 2),
+                            maxshape=(None, 3, 2))
+        file.create_dataset('entry/contiguous', data=frames)
+        file.create_dataset('entry/compressed', data=frames, chunks=(1, 3, 2),
+                            compression='gzip')
+
+    handler = HDF5MemmapHandler(str(path))
+    assert isinstance(handler(2), np.memmap)
+    np.testing.assert_array_equal(handler(2), frames[2:3])
+    handler.close()
+    np.testing.assert_array_equal(HDF5MemmapHandler(str(path), 2)(1),
+                                  frames[2:4])
+
+    class Contiguous(HDF5MemmapHandler):
+        _dataset_path = '/entry/contiguous'
+
+    assert isinstance(Contiguous(str(path), 2)(1), np.memmap)
+    np.testing.assert_array_equal(Contiguous(str(path), 2)(1), frames[2:4])
+
+    class Compressed(HDF5MemmapHandler):
+        _dataset_path = '/entry/compressed'
+
+    assert not isinstance(Compressed(str(path))(3), np.memmap)
+    np.testing.assert_array_equal(Compressed(str(path))(3), frames[3:4])
+
+
+def test_repr_html(parent, ari_ophyd):
+    output = parent._repr_html_()
+    assert output.startswith('<details open><summary><b>parent</b> (unknown)')
+    assert '<li>z: <code>5.0</code></li>' in output
+    assert '<li>locations: <code>[&#x27;measure&#x27;]</code></li>' in output
+    assert '<details><summary><b>holder</b> (device)' in output
+    assert '<li>x: <code>0.1</code></li>' in output
+    assert '<li>x: ' not in parent._repr_html_(depth=1)
+
+    m1 = make_fake_device(ari_ophyd.M1)('ARI_M1:', name='m1')
+    assert '<li>diag <i>(not built)</i></li>' in m1._repr_html_()
+    assert 'diag' not in m1._signals
+
+
+def test_repr_html_many_locations():
+    class Gauge(DeviceWithLocations):
+        a = Component(Signal, value=1.0, name='a')
+        b = Component(Signal, value=2.0, name='b')
+
+    locations_data = {'on': {'a': (1.0, 0.5), 'b': (2.0, 0.5)}}
+    # More LocationSignals than read executor workers, each of which reads
+    # its signals on that executor.
+    Rack = type('Rack', (DeviceWithLocations,), {
+        f'gauge{i}': Component(Gauge, name=f'gauge{i}',
+                               locations_data=locations_data)
+        for i in range(12)})
+    output = Rack('', name='rack')._repr_html_(timeout=5)
+    assert output.count('<li>locations: <code>[&#x27;on&#x27;]</code>') == 12
+    assert common_ophyd._read_executor().submit(int).result(timeout=1) == 0
+
+
+def test_find(parent, ari_ophyd):
+    assert parent.find('motor') == [parent.holder.x, parent.holder.y,
+                                    parent.z]
+    assert parent.find(label='device') == [parent.holder]
+    assert parent.find('missing') == []
+
+    m1 = make_fake_device(ari_ophyd.M1)('ARI_M1:', name='m1')
+    motors = [m1.Ry_coarse, m1.Ry_fine, m1.Rz, m1.x, m1.y]
+    assert m1.find('motor') == motors
+    assert m1.find('motor') is not m1._label_index['motor']
+    m1.diag.blade  # building a lazy sub-device re-indexes its parents
+    assert m1.find('motor') == motors + [m1.diag.blade, m1.diag.filter]
+    assert m1.slits.top in m1.find('motor', include_lazy=True)
+    assert m1.diag.camera in m1.find('detector')
+
+    # lazy components of devices that are not DeviceWithLocations re-index too
+    class Plugin(Device):
+        total = Component(Signal, name='total', labels=('stat',), lazy=True)
+
+    class Camera(Device):
+        stats = Component(Plugin, 'Stats:', lazy=True)
+
+    class Rig(DeviceWithLocations):
+        camera = Component(Camera, 'Cam:')
+
+    rig = Rig('', name='rig')
+    assert rig.find('stat') == []
+    rig.camera.stats.total  # a lazy camera plugin (signal) built after find()
+    assert rig.find('stat') == [rig.camera.stats.total]
+    diag = make_fake_device(common_ophyd.Diagnostic)('D:', name='diag')
+    assert diag.camera in diag.find('detector')
+    diag.camera.cam.array_rate  # a lazy signal of the camera's cam plugin
+    assert diag._label_index is None
+
+
+def test_bluesky_test_setup_profile(tmp_path):
+    pytest.importorskip('bluesky')
+    pytest.importorskip('databroker')
+    report = tmp_path / 'startup.json'
+    subprocess.run([sys.executable, 'bluesky_test_setup.py'],
+                   cwd=Path(common_ophyd.__file__).parent, check=True,
+                   timeout=60, env={**os.environ, 'ARI_SIMULATE': '1',
+                                    'ARI_STARTUP_PROFILE': str(report)})
+    profile = json.loads(report.read_text())
+    assert profile['simulated']
+    assert list(profile['phases']) == ['imports', 'run_engine', 'callbacks',
+                                       'databroker', 'device_construction',
+                                       'connection']
+    assert profile['connections']['failed'] == []
+
+
+def test_id29em_kinds():
+    em = make_fake_device(ID29EM)('EM:', name='em')
+    assert Kind.hinted in em.current1.kind
+    assert em.em_range.kind == Kind.config
+    assert em.conf.kind == Kind.omitted
+    assert em.acquire.kind == Kind.omitted
+    assert em.current1.centroid.kind == Kind.omitted
+    assert ID29EM._component_kinds['current4'] == Kind.hinted
+
+
+def test_id29em_set_ports():
+    em = make_fake_device(ID29EM)('EM:', name='em')
+    # Construction no longer writes the ports.
+    assert em.current1.nd_array_port.get() != 'EM180'
+    em.current2.nd_array_port.sim_put('EM180')
+    assert em.set_ports() == ['current1', 'current3', 'current4']
+    assert {getattr(em, f'current{i}').nd_array_port.get()
+            for i in range(1, 5)} == {'EM180'}
+    assert em.set_ports() == []
+
+    # A write that never completes times out rather than blocking stage().
+    em.current1.nd_array_port.sim_put('other')
+    em.current1.nd_array_port.set = lambda value, timeout=None: Status()
+    with pytest.raises(WaitTimeoutError):
+        em.set_ports(timeout=0.1)
+
+
+class ConnectingSignal(Signal):
+    def __init__(self, *args, delay=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metadata['connected'] = False
+        if delay is not None:
+            threading.Timer(delay, self._connect).start()
+
+    def _connect(self):
+        self._metadata['connected'] = True
+        # The dummy control layer does not dispatch metadata callbacks.
+        self._run_subs(sub_type=self.SUB_META, **self._metadata)
+
+
+def test_connect_all():
+    class Gauges(DeviceWithLocations):
+        fast = Component(ConnectingSignal, delay=0.05, name='fast')
+        unplugged = Component(ConnectingSignal, name='unplugged')
+        holder = Component(Holder, name='holder', lazy=True)
+
+    gauges = Gauges('', name='gauges')
+    report = connect_all(gauges, timeout=0.5)
+    assert report['failed'] == ['gauges_unplugged']
+    assert 0.05 <= report['signals']['gauges_fast']['latency'] < 0.5
+    assert report['signals']['gauges_locations']['latency'] == 0.0
+    assert report['signals']['gauges_unplugged']['latency'] is None
+    assert 'holder' not in gauges._signals
+
+    report = connect_all(gauges, timeout=0.1, include_lazy=True)
+    assert report['signals']['gauges_holder_x']['connected']
+    assert report['failed'] == ['gauges_unplugged']
+
+
+def test_connect_all_connected_before_subscribing():
+    class RacingSignal(Signal):
+        # Connects (without a 'meta' callback) just after it is checked.
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._metadata['connected'] = False
+            self._checks = 0
+
+        @property
+        def connected(self):
+            self._checks += 1
+            if self._checks > 1:
+                self._metadata['connected'] = True
+            return self._metadata['connected']
+
+    class Gauges(DeviceWithLocations):
+        racing = Component(RacingSignal, name='racing')
+
+    report = connect_all(Gauges('', name='gauges'), timeout=5)
+    assert report['failed'] == []
+    assert report['signals']['gauges_racing']['latency'] is not None